@@ -0,0 +1,138 @@
+"""
+媒体库刮削插件离线基准测试
+
+生成合成媒体库，用假的MoviePilot主程序模块和本地图片服务器运行插件，
+输出每次运行的耗时、上游接口调用次数和存储操作次数，不需要网络。
+
+生成的文件修改时间默认提前30天（--age-days），插件使用7天的pre_day窗口，
+因此开启增量刮削（--config '{"incremental": true}'）时第二次运行会跳过未变化的目录。
+上游限速默认关闭，以便衡量插件自身的开销，需要时用--config '{"host_rate": 10}'开启。
+
+用法：
+    python benchmarks/libraryscraper/bench.py --movies 500 --shows 30 --runs 2
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import stubs  # noqa: E402
+from imageserver import ImageServer  # noqa: E402
+from library import LibrarySpec, generate  # noqa: E402
+
+PLUGIN_PATH = Path(__file__).resolve().parents[2] / "plugins.v2" / "libraryscraper"
+
+
+def load_plugin():
+    """
+    按包加载插件，插件目录名不是合法的模块路径
+    """
+    spec = importlib.util.spec_from_file_location("libraryscraper", PLUGIN_PATH / "__init__.py",
+                                                  submodule_search_locations=[str(PLUGIN_PATH)])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["libraryscraper"] = module
+    spec.loader.exec_module(module)
+    return module.LibraryScraperOwn
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="媒体库刮削插件离线基准测试")
+    parser.add_argument("--movies", type=int, default=200, help="普通电影数")
+    parser.add_argument("--bluray", type=int, default=20, help="蓝光原盘电影数")
+    parser.add_argument("--shows", type=int, default=20, help="电视剧数")
+    parser.add_argument("--seasons", type=int, default=3, help="每部电视剧的季数")
+    parser.add_argument("--episodes", type=int, default=10, help="每季集数")
+    parser.add_argument("--specials", type=float, default=0.5, help="有特别篇的电视剧比例")
+    parser.add_argument("--age-days", type=int, default=30, help="媒体文件修改时间提前的天数，0为不修改")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="上游接口延迟秒数")
+    parser.add_argument("--image-latency", type=float, default=0.05, help="图片下载延迟秒数")
+    parser.add_argument("--image-size", type=int, default=16 * 1024, help="图片字节数")
+    parser.add_argument("--runs", type=int, default=2, help="在同一媒体库上连续运行的次数")
+    parser.add_argument("--overwrite", action="store_true", help="覆盖模式")
+    parser.add_argument("--config", type=str, default="{}", help="额外的插件配置，JSON格式")
+    parser.add_argument("--workdir", type=str, help="工作目录，默认使用临时目录并在结束后删除")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出结果")
+    parser.add_argument("--verbose", action="store_true", help="输出插件日志")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="libraryscraper-bench-"))
+    server = ImageServer(latency=args.image_latency, size=args.image_size)
+    server.start()
+    try:
+        spec = LibrarySpec(movies=args.movies, bluray=args.bluray, shows=args.shows, seasons=args.seasons,
+                           episodes=args.episodes, specials_ratio=args.specials, age_days=args.age_days)
+        (workdir / "temp").mkdir(parents=True, exist_ok=True)
+        scraper_paths = generate(workdir / "library", spec)
+        stubs.install(image_host=server.host, temp_path=workdir / "temp", data_path=workdir / "data",
+                      latency=args.api_latency)
+        plugin_class = load_plugin()
+        plugin = plugin_class()
+        config = {
+            "enabled": False,
+            "onlyonce": False,
+            "mode": "overwrite" if args.overwrite else "",
+            "scraper_paths": scraper_paths,
+            "exclude_paths": "",
+            # 插件中pre_day为0时按7天处理，这里显式使用7天，生成的文件默认早于该窗口
+            "pre_day": 7,
+            # 不限速，衡量插件自身的开销
+            "host_rate": 0,
+        }
+        config.update(json.loads(args.config))
+        plugin.init_plugin(config)
+        results = []
+        for run in range(1, args.runs + 1):
+            stubs.stats.reset()
+            server.reset()
+            begin = time.perf_counter()
+            plugin._LibraryScraperOwn__libraryscraper()
+            elapsed = time.perf_counter() - begin
+            calls = stubs.stats.snapshot()
+            run_stats = (plugin.get_data("run_stats") or [{}])[-1]
+            results.append({
+                "run": run,
+                "wall_time": round(elapsed, 3),
+                "media_files": spec.files,
+                "image_requests": server.requests,
+                "image_bytes": server.bytes_sent,
+                "upstream": {name: count for name, count in sorted(calls.items())
+                             if not name.startswith("storage.") and not name.startswith("db.")},
+                "storage": {name: count for name, count in sorted(calls.items())
+                            if name.startswith("storage.")},
+                "db": {name: count for name, count in sorted(calls.items()) if name.startswith("db.")},
+                "writes": {name: count for name, count in sorted((run_stats.get("counters") or {}).items())
+                           if name.startswith("storage_write_")},
+                "stages": run_stats.get("stages") or {},
+            })
+        plugin.stop_service()
+    finally:
+        server.stop()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    for result in results:
+        print(f"第{result['run']}次运行：耗时 {result['wall_time']} 秒，媒体文件 {result['media_files']} 个，"
+              f"图片请求 {result['image_requests']} 次，{result['image_bytes']} 字节")
+        for group in ("upstream", "storage", "db", "writes"):
+            for name, count in result[group].items():
+                print(f"  {name:<28}{count}")
+        for stage, item in result["stages"].items():
+            print(f"  {item['name']:<24}次数 {item['count']:<8}P50 {item['p50']:<8}P95 {item['p95']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+本地图片服务器，模拟TMDB图片域名，每个请求注入固定延迟
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ImageServer:
+    """
+    在127.0.0.1随机端口上提供假图片
+    """
+
+    def __init__(self, latency: float = 0.05, size: int = 16 * 1024):
+        """
+        :param latency: 每个请求的延迟秒数
+        :param size: 返回的图片字节数
+        """
+        self.latency = latency
+        self.requests = 0
+        self.bytes_sent = 0
+        self._content = b"\xff\xd8\xff\xe0" + b"\0" * max(0, size - 4)
+        self._lock = threading.Lock()
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                time.sleep(server.latency)
+                with server._lock:
+                    server.requests += 1
+                    server.bytes_sent += len(server._content)
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(server._content)))
+                self.end_headers()
+                self.wfile.write(server._content)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def host(self) -> str:
+        return f"127.0.0.1:{self._httpd.server_address[1]}"
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.bytes_sent = 0
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
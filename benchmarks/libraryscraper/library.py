@@ -0,0 +1,81 @@
+"""
+生成合成媒体库：电影、蓝光原盘、多季电视剧和特别篇，媒体文件均为空文件
+"""
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass
+class LibrarySpec:
+    """
+    合成媒体库规模
+    """
+    # 普通电影数
+    movies: int = 200
+    # 蓝光原盘电影数
+    bluray: int = 20
+    # 电视剧数
+    shows: int = 20
+    # 每部电视剧的季数
+    seasons: int = 3
+    # 每季集数
+    episodes: int = 10
+    # 有特别篇的电视剧比例
+    specials_ratio: float = 0.5
+    # 文件和目录的修改时间提前的天数，超过插件的pre_day时才会被增量刮削跳过
+    age_days: int = 30
+
+    @property
+    def files(self) -> int:
+        specials = int(self.shows * self.specials_ratio)
+        return self.movies + self.bluray + self.shows * self.seasons * self.episodes + specials * 2
+
+
+def _touch(path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+
+
+def _backdate(root: Path, days: int):
+    """
+    将root下所有文件和目录的修改时间提前days天，模拟已入库一段时间的媒体
+    """
+    if days <= 0:
+        return
+    mtime = time.time() - days * 86400
+    # 自底向上修改，避免修改文件时刷新所在目录的修改时间
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        for name in filenames:
+            os.utime(Path(dirpath) / name, (mtime, mtime))
+        os.utime(dirpath, (mtime, mtime))
+
+
+def generate(root: Path, spec: LibrarySpec) -> str:
+    """
+    在root下生成电影和电视剧目录
+    :return: 插件的刮削路径配置
+    """
+    movie_root = root / "movies"
+    tv_root = root / "tv"
+    for index in range(spec.movies):
+        title = f"Movie {index:05d} ({1950 + index % 70})"
+        _touch(movie_root / title / f"{title}.mkv")
+    for index in range(spec.bluray):
+        title = f"Bluray {index:05d} ({1980 + index % 40})"
+        _touch(movie_root / title / "BDMV" / "STREAM" / "00000.m2ts")
+        (movie_root / title / "CERTIFICATE").mkdir(parents=True, exist_ok=True)
+    specials = int(spec.shows * spec.specials_ratio)
+    for index in range(spec.shows):
+        title = f"Show {index:05d} ({1990 + index % 30})"
+        for season in range(1, spec.seasons + 1):
+            for episode in range(1, spec.episodes + 1):
+                _touch(tv_root / title / f"Season {season}" / f"{title} - S{season:02d}E{episode:02d}.mkv")
+        if index < specials:
+            for episode in range(1, 3):
+                _touch(tv_root / title / "Specials" / f"{title} - S00E{episode:02d}.mkv")
+    movie_root.mkdir(parents=True, exist_ok=True)
+    tv_root.mkdir(parents=True, exist_ok=True)
+    _backdate(root, spec.age_days)
+    return f"{movie_root}#电影\n{tv_root}#电视剧"
@@ -0,0 +1,503 @@
+"""
+替代MoviePilot主程序的app模块，插件调用的上游接口和存储操作都在本地完成并计数
+
+- 识别、图片地址、nfo生成、剧集详情等上游接口按配置注入延迟
+- 存储操作直接访问本地文件系统
+- 图片地址指向本地图片服务器
+"""
+import hashlib
+import logging
+import os
+import random
+import re
+import shutil
+import string
+import sys
+import threading
+import time
+import types
+import xml.etree.ElementTree as ET
+from collections import Counter
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Column, Integer, String, create_engine, event
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+class CallStats:
+    """
+    上游接口和存储操作计数
+    """
+
+    def __init__(self):
+        self._counter = Counter()
+        self._lock = threading.Lock()
+
+    def incr(self, name: str):
+        with self._lock:
+            self._counter[name] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counter.clear()
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counter)
+
+
+stats = CallStats()
+
+
+class _Upstream:
+    """
+    上游接口延迟配置
+    """
+    latency = 0.02
+
+    @classmethod
+    def call(cls, name: str):
+        stats.incr(name)
+        if cls.latency:
+            time.sleep(cls.latency)
+
+
+# ---------- app.schemas ----------
+
+class MediaType(Enum):
+    MOVIE = '电影'
+    TV = '电视剧'
+    UNKNOWN = '未知'
+
+
+@dataclass
+class FileItem:
+    storage: str = "local"
+    type: Optional[str] = None
+    path: str = "/"
+    name: str = ""
+    basename: Optional[str] = None
+    extension: Optional[str] = None
+    size: Optional[int] = None
+    modify_time: Optional[float] = None
+    fileid: Optional[str] = None
+    parent_fileid: Optional[str] = None
+
+
+@dataclass
+class TmdbEpisode:
+    episode_number: Optional[int] = None
+    season_number: Optional[int] = None
+    still_path: Optional[str] = None
+    name: Optional[str] = None
+
+
+@dataclass
+class Response:
+    success: bool = False
+    message: Optional[str] = None
+    data: Any = None
+
+
+# ---------- app.core.config ----------
+
+class Settings:
+    TZ = "Asia/Shanghai"
+    TEMP_PATH = Path("/tmp")
+    PROXY = None
+    API_TOKEN = "benchmark"
+    TMDB_API_DOMAIN = "api.themoviedb.org"
+    TMDB_IMAGE_DOMAIN = "image.tmdb.org"
+    SCRAP_FOLLOW_TMDB = False
+    RMT_MEDIAEXT = ['.mp4', '.mkv', '.ts', '.iso', '.rmvb', '.avi', '.mov', '.mpeg', '.mpg', '.wmv',
+                    '.3gp', '.asf', '.m4v', '.flv', '.m2ts', '.strm', '.tp', '.f4v']
+    RENAME_FORMAT_S0_NAMES = ["Specials", "SPs"]
+    MOVIE_RENAME_FORMAT = "{{title}}{% if year %} ({{year}}){% endif %}" \
+                          "/{{title}}{% if year %} ({{year}}){% endif %}{{fileExt}}"
+    TV_RENAME_FORMAT = "{{title}}{% if year %} ({{year}}){% endif %}" \
+                       "/Season {{season}}/{{title}} - {{season_episode}}{{fileExt}}"
+
+
+settings = Settings()
+
+
+# ---------- app.log ----------
+
+class _Logger:
+    def __init__(self):
+        self._logger = logging.getLogger("libraryscraper.benchmark")
+
+    def debug(self, msg, *args, **kwargs):
+        self._logger.debug(msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self._logger.info(msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self._logger.warning(msg, *args, **kwargs)
+
+    warn = warning
+
+    def error(self, msg, *args, **kwargs):
+        self._logger.error(msg, *args, **kwargs)
+
+
+logger = _Logger()
+
+
+# ---------- app.core.meta / app.core.metainfo ----------
+
+class MetaBase:
+    def __init__(self, name: str = "", year: Optional[str] = None, mtype: MediaType = MediaType.UNKNOWN,
+                 begin_season: Optional[int] = None, begin_episode: Optional[int] = None):
+        self.name = name
+        self.year = year
+        self.type = mtype
+        self.begin_season = begin_season
+        self.begin_episode = begin_episode
+
+    @property
+    def season(self) -> str:
+        return f"S{self.begin_season:02d}" if self.begin_season is not None else ""
+
+
+_title_re = re.compile(r"^(.+?) \((\d{4})\)$")
+_episode_re = re.compile(r"S(\d+)E(\d+)", re.I)
+_season_re = re.compile(r"^Season (\d+)$", re.I)
+
+
+def MetaInfo(title: str) -> MetaBase:
+    meta = MetaBase(name=title)
+    matched = _season_re.match(title)
+    if matched:
+        meta.begin_season = int(matched.group(1))
+        return meta
+    matched = _title_re.match(title)
+    if matched:
+        meta.name, meta.year = matched.group(1), matched.group(2)
+    return meta
+
+
+def MetaInfoPath(path: Path) -> MetaBase:
+    meta = MetaBase()
+    matched = _episode_re.search(path.name)
+    if matched:
+        meta.type = MediaType.TV
+        meta.begin_season, meta.begin_episode = int(matched.group(1)), int(matched.group(2))
+    else:
+        meta.type = MediaType.MOVIE
+    for part in [path.stem] + [parent.name for parent in path.parents]:
+        matched = _title_re.match(part)
+        if matched:
+            meta.name, meta.year = matched.group(1), matched.group(2)
+            break
+    return meta
+
+
+# ---------- app.core.context ----------
+
+class MediaInfo:
+    def __init__(self, tmdb_id: int, mtype: MediaType, title: str, year: Optional[str] = None):
+        self.tmdb_id = tmdb_id
+        self.type = mtype
+        self.title = title
+        self.year = year
+        self.episode_group = None
+        self.poster_path = None
+        self.backdrop_path = None
+
+
+class Context:
+    pass
+
+
+# tmdbid -> (名称, 年份)，按tmdbid识别时返回与按名称识别一致的结果
+_titles: Dict[int, tuple] = {}
+
+
+def _tmdbid(name: str, year: Optional[str]) -> int:
+    tmdbid = int(hashlib.md5(name.encode("utf-8")).hexdigest()[:7], 16)
+    _titles[tmdbid] = (name, year)
+    return tmdbid
+
+
+def _image_url(name: str) -> str:
+    return f"http://{settings.TMDB_IMAGE_DOMAIN}/t/p/original/{name}"
+
+
+def _recognize(meta: MetaBase = None, mtype: MediaType = None, tmdbid: int = None) -> Optional[MediaInfo]:
+    _Upstream.call("recognize_media")
+    if tmdbid:
+        title, year = _titles.get(int(tmdbid), (str(tmdbid), None))
+        return MediaInfo(tmdb_id=int(tmdbid), mtype=mtype or (meta.type if meta else MediaType.MOVIE),
+                         title=title, year=year)
+    if not meta or not meta.name:
+        return None
+    return MediaInfo(tmdb_id=_tmdbid(meta.name, meta.year), mtype=meta.type, title=meta.name, year=meta.year)
+
+
+# ---------- app.chain.media / app.chain.tmdb ----------
+
+class MediaChain:
+    def recognize_media(self, meta: MetaBase = None, mtype: MediaType = None, tmdbid: int = None,
+                        episode_group: str = None, **kwargs) -> Optional[MediaInfo]:
+        return _recognize(meta=meta, mtype=mtype or (MediaType.TV if episode_group or meta else None),
+                          tmdbid=tmdbid)
+
+    def recognize_by_meta(self, meta: MetaBase) -> Optional[MediaInfo]:
+        return _recognize(meta=meta)
+
+    def metadata_nfo(self, meta: MetaBase, mediainfo: MediaInfo,
+                     season: int = None, episode: int = None) -> Optional[str]:
+        _Upstream.call("metadata_nfo")
+        root = ET.Element("episodedetails" if episode is not None else
+                          "season" if season is not None else
+                          "tvshow" if mediainfo.type == MediaType.TV else "movie")
+        ET.SubElement(root, "title").text = mediainfo.title
+        ET.SubElement(root, "dateadded").text = time.strftime("%Y-%m-%d %H:%M:%S")
+        uniqueid = ET.SubElement(root, "uniqueid", type="tmdb", default="true")
+        uniqueid.text = str(mediainfo.tmdb_id)
+        ET.SubElement(root, "tmdbid").text = str(mediainfo.tmdb_id)
+        if season is not None:
+            ET.SubElement(root, "season").text = str(season)
+        if episode is not None:
+            ET.SubElement(root, "episode").text = str(episode)
+        return ET.tostring(root, encoding="unicode")
+
+    def metadata_img(self, mediainfo: MediaInfo, season: int = None, episode: int = None) -> Optional[dict]:
+        _Upstream.call("metadata_img")
+        tmdbid = mediainfo.tmdb_id
+        if episode is not None:
+            return {f"{episode}.jpg": _image_url(f"{tmdbid}-s{season}e{episode}.jpg")}
+        if season is not None:
+            return {f"season{season:02d}-poster.jpg": _image_url(f"{tmdbid}-s{season}.jpg")}
+        return {
+            "poster.jpg": _image_url(f"{tmdbid}-poster.jpg"),
+            "fanart.jpg": _image_url(f"{tmdbid}-fanart.jpg"),
+            "season01-poster.jpg": _image_url(f"{tmdbid}-fanart-s1.jpg"),
+        }
+
+
+class TmdbChain:
+    def tmdb_episodes(self, tmdbid: int, season: int, episode_group: str = None) -> List[TmdbEpisode]:
+        _Upstream.call("tmdb_episodes")
+        return [TmdbEpisode(episode_number=episode, season_number=season,
+                            still_path=f"/{tmdbid}-s{season}e{episode}.jpg") for episode in range(1, 101)]
+
+
+# ---------- app.chain.storage ----------
+
+def _fileitem(path: Path, storage: str = "local") -> FileItem:
+    stat = path.stat()
+    if path.is_dir():
+        return FileItem(storage=storage, type="dir", path=path.as_posix() + "/", name=path.name,
+                        basename=path.name, modify_time=stat.st_mtime)
+    return FileItem(storage=storage, type="file", path=path.as_posix(), name=path.name, basename=path.stem,
+                    extension=path.suffix[1:], size=stat.st_size, modify_time=stat.st_mtime)
+
+
+class StorageChain:
+    def list_files(self, fileitem: FileItem, recursion: bool = False) -> Optional[List[FileItem]]:
+        stats.incr("storage.list_files")
+        path = Path(fileitem.path)
+        if not path.is_dir():
+            return []
+        return [_fileitem(child, fileitem.storage) for child in sorted(path.iterdir())]
+
+    def get_file_item(self, storage: str, path: Path) -> Optional[FileItem]:
+        stats.incr("storage.get_file_item")
+        return _fileitem(path, storage) if path.exists() else None
+
+    def get_parent_item(self, fileitem: FileItem) -> Optional[FileItem]:
+        stats.incr("storage.get_parent_item")
+        return _fileitem(Path(fileitem.path).parent, fileitem.storage)
+
+    def upload_file(self, fileitem: FileItem, path: Path, new_name: Optional[str] = None) -> Optional[FileItem]:
+        stats.incr("storage.upload_file")
+        target = Path(fileitem.path) / (new_name or path.name)
+        shutil.copyfile(path, target)
+        return _fileitem(target, fileitem.storage)
+
+
+# ---------- app.db ----------
+
+Engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+SessionFactory = sessionmaker(bind=Engine)
+Base = declarative_base()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(*args, **kwargs):
+    stats.incr("db.query")
+
+
+class TransferHistory(Base):
+    __tablename__ = "transferhistory"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    type = Column(String)
+    title = Column(String)
+    tmdbid = Column(Integer, index=True)
+
+
+class TransferHistoryOper:
+    def get_by_type_tmdbid(self, mtype: str = None, tmdbid: int = None):
+        with SessionFactory() as db:
+            return db.query(TransferHistory).filter(TransferHistory.type == mtype,
+                                                    TransferHistory.tmdbid == tmdbid).first()
+
+
+# ---------- app.helper.nfo ----------
+
+class NfoReader:
+    def __init__(self, xml_file_path: Path):
+        self.root = ET.parse(str(xml_file_path)).getroot()
+
+    def get_element_value(self, element_path: str) -> Optional[str]:
+        element = self.root.find(element_path)
+        return element.text if element is not None else None
+
+
+# ---------- app.utils ----------
+
+class SystemUtils:
+    @staticmethod
+    def link(src: Path, dest: Path):
+        try:
+            os.link(src, dest)
+            return 0, ""
+        except OSError as err:
+            return -1, str(err)
+
+    @staticmethod
+    def copy(src: Path, dest: Path):
+        try:
+            shutil.copy2(src, dest)
+            return 0, ""
+        except OSError as err:
+            return -1, str(err)
+
+
+class StringUtils:
+    @staticmethod
+    def generate_random_str(randomlength: int = 16) -> str:
+        return "".join(random.choices(string.ascii_letters + string.digits, k=randomlength))
+
+    @staticmethod
+    def str_filesize(size: Any, pre: int = 2) -> str:
+        size = float(size or 0)
+        for unit in ["B", "K", "M", "G"]:
+            if size < 1024:
+                return f"{round(size, pre)}{unit}"
+            size /= 1024
+        return f"{round(size, pre)}T"
+
+
+class RequestUtils:
+    def __init__(self, proxies: Any = None, session: Any = None, timeout: int = 20, **kwargs):
+        self._session = session
+        self._timeout = timeout
+
+    def get_res(self, url: str, **kwargs):
+        # 本地图片服务器只支持http
+        url = url.replace("https://", "http://", 1)
+        stats.incr("http.get")
+        try:
+            if self._session:
+                return self._session.get(url, timeout=self._timeout)
+            import requests
+            return requests.get(url, timeout=self._timeout)
+        except Exception:
+            return None
+
+
+# ---------- app.plugins ----------
+
+class PluginChain:
+    def recognize_media(self, meta: MetaBase = None, mtype: MediaType = None, tmdbid: int = None,
+                        **kwargs) -> Optional[MediaInfo]:
+        return _recognize(meta=meta, mtype=mtype, tmdbid=tmdbid)
+
+    def obtain_images(self, mediainfo: MediaInfo) -> MediaInfo:
+        _Upstream.call("obtain_images")
+        mediainfo.poster_path = _image_url(f"{mediainfo.tmdb_id}-poster.jpg")
+        mediainfo.backdrop_path = _image_url(f"{mediainfo.tmdb_id}-backdrop.jpg")
+        return mediainfo
+
+
+class _PluginBase:
+    # 由基准测试设置
+    data_path: Path = Path("/tmp")
+
+    def __init__(self):
+        self.chain = PluginChain()
+        self._data: Dict[str, Any] = {}
+
+    def get_data_path(self) -> Path:
+        self.data_path.mkdir(parents=True, exist_ok=True)
+        return self.data_path
+
+    def save_data(self, key: str, value: Any):
+        self._data[key] = value
+
+    def get_data(self, key: str) -> Any:
+        return self._data.get(key)
+
+    def update_config(self, config: dict):
+        pass
+
+
+def install(image_host: str, temp_path: Path, data_path: Path, latency: float):
+    """
+    注册假的app模块，需要在导入插件之前调用
+    :param image_host: 本地图片服务器地址
+    :param temp_path: 临时目录
+    :param data_path: 插件数据目录
+    :param latency: 上游接口延迟秒数
+    """
+    settings.TMDB_IMAGE_DOMAIN = image_host
+    settings.TEMP_PATH = temp_path
+    _PluginBase.data_path = data_path
+    _Upstream.latency = latency
+    Base.metadata.create_all(Engine)
+    module_items = {
+        "app": {},
+        "app.schemas": {"MediaType": MediaType, "FileItem": FileItem, "TmdbEpisode": TmdbEpisode,
+                        "Response": Response},
+        "app.chain": {},
+        "app.chain.media": {"MediaChain": MediaChain},
+        "app.chain.storage": {"StorageChain": StorageChain},
+        "app.chain.tmdb": {"TmdbChain": TmdbChain},
+        "app.core": {},
+        "app.core.config": {"settings": settings},
+        "app.core.meta": {"MetaBase": MetaBase},
+        "app.core.metainfo": {"MetaInfo": MetaInfo, "MetaInfoPath": MetaInfoPath},
+        "app.core.context": {"Context": Context, "MediaInfo": MediaInfo},
+        "app.db": {"SessionFactory": SessionFactory},
+        "app.db.models": {},
+        "app.db.models.transferhistory": {"TransferHistory": TransferHistory},
+        "app.db.transferhistory_oper": {"TransferHistoryOper": TransferHistoryOper},
+        "app.helper": {},
+        "app.helper.nfo": {"NfoReader": NfoReader},
+        "app.log": {"logger": logger},
+        "app.plugins": {"_PluginBase": _PluginBase},
+        "app.utils": {},
+        "app.utils.system": {"SystemUtils": SystemUtils},
+        "app.utils.string": {"StringUtils": StringUtils},
+        "app.utils.http": {"RequestUtils": RequestUtils},
+    }
+    for name, items in module_items.items():
+        module = types.ModuleType(name)
+        module.__path__ = []
+        for attr, value in items.items():
+            setattr(module, attr, value)
+            # 识别缓存会pickle媒体信息，类需要能从模块中找到
+            if isinstance(value, type) and not issubclass(value, Base):
+                value.__module__ = name
+        sys.modules[name] = module
+        parent, _, child = name.rpartition(".")
+        if parent:
+            setattr(sys.modules[parent], child, module)
@@ -1,7 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
+from itertools import islice
 from pathlib import Path
-from threading import Event
-from typing import Optional, List, Tuple, Dict, Any, Union
+from threading import Event, Lock
+import time
+from typing import Optional, List, Tuple, Dict, Any, Union, Callable, Iterable, Iterator, Set, TypeVar
 
 import pytz
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -12,16 +15,34 @@ from app.chain.media import MediaChain
 from app.core.config import settings
 from app.core.metainfo import MetaInfo,MetaInfoPath
 from app.db.transferhistory_oper import TransferHistoryOper
-from app.helper.nfo import NfoReader
 from app.log import logger
 from app.plugins import _PluginBase
 from app.schemas import MediaType
+from app.utils.string import StringUtils
 from app.utils.system import SystemUtils
 from app.chain.storage import StorageChain
 from app.core.meta import MetaBase
 from app.core.context import Context, MediaInfo
-from app.utils.string import StringUtils
-from app.utils.http import RequestUtils
+
+from .discovery import LibraryDiscovery, MediaDir
+from .downloader import ImageDownloader, RetryQueue, RetryItem
+from .history import TransferTitles
+from .imagecache import ImageCache
+from .limiter import HostBlocked, HostGuard
+from .prefetch import SeasonPrefetch
+from .listing import DirListing
+from .metrics import RunMetrics, timer
+from .nfocache import NfoCache, NfoInfo
+from .planner import ScrapePlan, average_image_size
+from .recognizecache import RecognizeCache, RecognizeStore
+from .runcontext import RunContext
+from .scanindex import ScanIndex, DirFingerprint, RunCheckpoint
+from .scheduler import PriorityRequests, PriorityScheduler
+from .traversal import ScrapeState, ScrapeTask, DirFrame, FileTask, NfoTask, ImageTask, ReleaseTask
+from .watcher import LibraryWatcher
+from .writer import MetadataWriter
+
+T = TypeVar("T")
 
 class LibraryScraperOwn(_PluginBase):
     # 插件名称
@@ -54,8 +75,67 @@ class LibraryScraperOwn(_PluginBase):
     _mode = ""
     _scraper_paths = ""
     _exclude_paths = ""
+    # 增量刮削，跳过指纹未变化的目录
+    _incremental = False
+    # 并发刮削目录数
+    _max_workers = 1
+    # 同时下载的图片数
+    _image_workers = 4
+    # 每个上游域名每秒请求数，0为不限速
+    _host_rate = 10
+    # 本地图片缓存
+    _image_cache = False
+    # 图片缓存容量，单位MB
+    _image_cache_size = 1024
+    # 图片缓存有效期，单位天
+    _image_cache_ttl = 30
+    # 识别结果持久化缓存有效期，单位天，0为只缓存本次运行
+    _recognize_cache_ttl = 0
+    # 目录监控模式：fast 性能模式 / compatibility 兼容模式，为空不监控
+    _watch_mode = ""
+    # 目录监控合并变化的等待秒数
+    _watch_debounce = 60
+    _watcher: Optional[LibraryWatcher] = None
+    # 忽略上次中断的断点，下次运行重新开始
+    _fresh_run = False
+    # 发现目录时跳过近pre_day天内没有变化的目录
+    _recent_only = False
+    # 只生成刮削计划，不写入任何文件
+    _plan_only = False
+    # 按用户指定、缺失的元数据和最近变化时间排序后刮削
+    _priority = False
+    # 单次运行时长上限，单位分钟，0为不限制，未完成的目录下次运行继续
+    _time_budget = 0
+    # 没有下载记录时估算的每张图片字节数
+    _default_image_size = 256 * 1024
+    # 刮削任务运行中的图片下载流水线
+    _downloader: Optional[ImageDownloader] = None
+    # 刮削任务运行中的识别结果缓存
+    _recognize_cache: Optional[RecognizeCache] = None
+    # 刮削任务运行中的nfo解析缓存
+    _nfo_cache: Optional[NfoCache] = None
+    # 刮削任务运行中的元数据写入
+    _writer: Optional[MetadataWriter] = None
+    # 刮削任务运行中按季预取的剧集详情
+    _season_prefetch: Optional[SeasonPrefetch] = None
+    # 刮削任务运行中的上游限速和熔断
+    _host_guard: Optional[HostGuard] = None
+    # 刮削任务运行中的图片下载重试队列
+    _retry_queue: Optional[RetryQueue] = None
+    # 刮削任务运行中的性能统计
+    _metrics: Optional[RunMetrics] = None
+    # 刮削任务运行中预加载的整理记录标题
+    _transfer_titles: Optional[TransferTitles] = None
+    # 刮削任务运行中复用的处理链
+    _run_context: Optional[RunContext] = None
+    # 保留最近多少次运行的统计
+    _stats_history = 10
+    # 遍历目录时每次取出的子项数
+    _page_size = 200
     # 退出事件
     _event = Event()
+    # 同一时间只运行一个刮削任务
+    _run_lock = Lock()
 
     def init_plugin(self, config: dict = None):
 
@@ -67,8 +147,25 @@ class LibraryScraperOwn(_PluginBase):
             self._mode = config.get("mode") or ""
             self._scraper_paths = config.get("scraper_paths") or ""
             self._exclude_paths = config.get("exclude_paths") or ""
-            self._pre_day = config.get("pre_day") or 7
-            self.storagechain = StorageChain()
+            self._pre_day = self.__to_number(config.get("pre_day"), 7) or 7
+            self._incremental = config.get("incremental")
+            self._max_workers = self.__to_number(config.get("max_workers"), 1)
+            self._image_workers = self.__to_number(config.get("image_workers"), 4)
+            self._host_rate = self.__to_number(config.get("host_rate"), 10, float)
+            self._image_cache = config.get("image_cache")
+            self._image_cache_size = self.__to_number(config.get("image_cache_size"), 1024)
+            self._image_cache_ttl = self.__to_number(config.get("image_cache_ttl"), 30)
+            self._recognize_cache_ttl = self.__to_number(config.get("recognize_cache_ttl"), 0)
+            self._watch_mode = config.get("watch_mode") or ""
+            self._watch_debounce = self.__to_number(config.get("watch_debounce"), 60)
+            self._fresh_run = config.get("fresh_run")
+            self._recent_only = config.get("recent_only")
+            self._plan_only = config.get("plan_only")
+            self._priority = config.get("priority")
+            self._time_budget = self.__to_number(config.get("time_budget"), 0)
+
+        # 存储链长期复用，不依赖配置是否存在
+        self.storagechain = StorageChain()
 
         # 停止现有任务
         self.stop_service()
@@ -84,19 +181,69 @@ class LibraryScraperOwn(_PluginBase):
                                         name="媒体库刮削")
                 # 关闭一次性开关
                 self._onlyonce = False
-                self.update_config({
-                    "onlyonce": False,
-                    "enabled": self._enabled,
-                    "cron": self._cron,
-                    "mode": self._mode,
-                    "scraper_paths": self._scraper_paths,
-                    "exclude_paths": self._exclude_paths
-                })
+                self.__update_config()
                 if self._scheduler.get_jobs():
                     # 启动服务
                     self._scheduler.print_jobs()
                     self._scheduler.start()
 
+        # 启动目录监控
+        if self._enabled and self._watch_mode and self._scraper_paths:
+            if self._plan_only:
+                # 目录监控会直接刮削写入媒体库，只生成刮削计划时不启动
+                logger.info("只生成刮削计划，不启动目录监控")
+            else:
+                self._watcher = LibraryWatcher(
+                    discovery=LibraryDiscovery(exclude_paths=self._exclude_paths.split("\n"), event=self._event),
+                    roots=LibraryDiscovery.parse_paths(self._scraper_paths),
+                    callback=self.__scrape_media_dirs,
+                    debounce=self._watch_debounce,
+                    polling=self._watch_mode == "compatibility"
+                )
+                self._watcher.start()
+
+    @staticmethod
+    def __to_number(value: Any, default: Union[int, float], cast: Callable = int) -> Union[int, float]:
+        """
+        转换表单中填写的数字，为空或格式错误时使用默认值
+        """
+        if value is None or value == "":
+            return default
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            logger.warn(f"配置项格式错误：{value}，使用默认值 {default}")
+            return default
+
+    def __update_config(self):
+        """
+        保存当前配置
+        """
+        self.update_config({
+            "onlyonce": self._onlyonce,
+            "enabled": self._enabled,
+            "cron": self._cron,
+            "mode": self._mode,
+            "scraper_paths": self._scraper_paths,
+            "exclude_paths": self._exclude_paths,
+            "pre_day": self._pre_day,
+            "incremental": self._incremental,
+            "max_workers": self._max_workers,
+            "image_workers": self._image_workers,
+            "host_rate": self._host_rate,
+            "image_cache": self._image_cache,
+            "image_cache_size": self._image_cache_size,
+            "image_cache_ttl": self._image_cache_ttl,
+            "recognize_cache_ttl": self._recognize_cache_ttl,
+            "watch_mode": self._watch_mode,
+            "watch_debounce": self._watch_debounce,
+            "fresh_run": self._fresh_run,
+            "recent_only": self._recent_only,
+            "plan_only": self._plan_only,
+            "priority": self._priority,
+            "time_budget": self._time_budget
+        })
+
     def get_state(self) -> bool:
         return self._enabled
 
@@ -105,7 +252,58 @@ class LibraryScraperOwn(_PluginBase):
         pass
 
     def get_api(self) -> List[Dict[str, Any]]:
-        pass
+        return [{
+            "path": "/stats",
+            "endpoint": self.get_stats,
+            "methods": ["GET"],
+            "summary": "刮削运行统计",
+            "description": "获取最近几次刮削运行的各阶段耗时、缓存命中率和下载流量",
+        }, {
+            "path": "/plan",
+            "endpoint": self.get_plan,
+            "methods": ["GET"],
+            "summary": "刮削计划",
+            "description": "获取最近一次生成的刮削计划：目录数、缺失的nfo和图片、估算的上游请求数和下载量",
+        }, {
+            "path": "/prioritize",
+            "endpoint": self.prioritize,
+            "methods": ["POST"],
+            "summary": "优先刮削",
+            "description": "指定下次运行时优先刮削的媒体目录、上级目录或媒体文件",
+        }]
+
+    def get_stats(self, apikey: str) -> schemas.Response:
+        """
+        API：获取最近几次刮削运行的统计
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        return schemas.Response(success=True, data=self.get_data("run_stats") or [])
+
+    def get_plan(self, apikey: str) -> schemas.Response:
+        """
+        API：获取最近一次生成的刮削计划
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        return schemas.Response(success=True, data=self.get_data("scrape_plan") or {})
+
+    def prioritize(self, apikey: str, path: str) -> schemas.Response:
+        """
+        API：加入优先刮削路径，开启优先级调度时下次运行最先刮削
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        if not path:
+            return schemas.Response(success=False, message="路径不能为空")
+        requests = PriorityRequests(self.get_data_path() / "scraper.db")
+        try:
+            requests.add(Path(path))
+        finally:
+            requests.close()
+        if not self._priority:
+            return schemas.Response(success=True, message="已加入优先刮削队列，开启优先级调度后生效")
+        return schemas.Response(success=True, message="已加入优先刮削队列，下次运行时优先处理")
 
     def get_service(self) -> List[Dict[str, Any]]:
         """
@@ -176,6 +374,78 @@ class LibraryScraperOwn(_PluginBase):
                                     }
                                 ]
                             },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'fresh_run',
+                                            'label': '忽略断点重新刮削',
+                                            'hint': '上次运行中断时默认从断点继续，开启后下次运行从头开始',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'recent_only',
+                                            'label': '只刮削近期变化的目录',
+                                            'hint': '按目录和文件修改时间、nfo添加时间跳过近几天内没有变化的目录',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'plan_only',
+                                            'label': '只生成刮削计划',
+                                            'hint': '只检查缺失的nfo和图片并估算上游请求数和下载量，不写入任何文件',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'priority',
+                                            'label': '优先刮削新增和不完整的目录',
+                                            'hint': '按指定路径、缺失nfo和海报、最近变化时间排序，需先遍历并记录全部目录，媒体库很大时占用较多内存',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
                             {
                                 'component': 'VTextField',
                                 'props': {
@@ -193,7 +463,7 @@ class LibraryScraperOwn(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 6
+                                    'md': 4
                                 },
                                 'content': [
                                     {
@@ -213,7 +483,7 @@ class LibraryScraperOwn(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 6
+                                    'md': 4
                                 },
                                 'content': [
                                     {
@@ -225,6 +495,228 @@ class LibraryScraperOwn(_PluginBase):
                                         }
                                     }
                                 ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'time_budget',
+                                            'label': '单次运行时长上限（分钟）',
+                                            'placeholder': '0',
+                                            'hint': '到达上限后不再开始新的目录，剩余目录下次运行继续，0为不限制',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'incremental',
+                                            'label': '增量刮削',
+                                            'hint': '跳过上次刮削后未发生变化的媒体目录',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'max_workers',
+                                            'label': '并发数',
+                                            'placeholder': '1',
+                                            'hint': '同时刮削的目录数量',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'image_workers',
+                                            'label': '图片下载并发数',
+                                            'placeholder': '4',
+                                            'hint': '后台同时下载的图片数量',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSelect',
+                                        'props': {
+                                            'model': 'watch_mode',
+                                            'label': '目录监控',
+                                            'items': [
+                                                {'title': '不监控', 'value': ''},
+                                                {'title': '性能模式', 'value': 'fast'},
+                                                {'title': '兼容模式', 'value': 'compatibility'},
+                                            ],
+                                            'hint': '监控刮削路径变化，实时刮削新增的媒体目录；网络共享目录请使用兼容模式',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'watch_debounce',
+                                            'label': '监控延迟(秒)',
+                                            'placeholder': '60',
+                                            'hint': '目录最后一次变化后等待的时间，期间的变化合并处理',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'host_rate',
+                                            'label': '上游请求限速(次/秒)',
+                                            'placeholder': '10',
+                                            'hint': '每个域名每秒请求数，连续失败时自动暂停，0为不限速',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'image_cache',
+                                            'label': '图片缓存',
+                                            'hint': '缓存已下载的图片，相同图片不再重复下载',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'image_cache_size',
+                                            'label': '图片缓存容量(MB)',
+                                            'placeholder': '1024'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'image_cache_ttl',
+                                            'label': '图片缓存有效期(天)',
+                                            'placeholder': '30'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'recognize_cache_ttl',
+                                            'label': '识别缓存有效期(天)',
+                                            'placeholder': '0',
+                                            'hint': '0为仅在本次运行内缓存',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
                             }
                         ]
                     },
@@ -301,11 +793,158 @@ class LibraryScraperOwn(_PluginBase):
             "cron": "0 0 */7 * *",
             "mode": "",
             "scraper_paths": "",
+            "incremental": True,
+            "max_workers": 1,
+            "image_workers": 4,
+            "host_rate": 10,
+            "image_cache": True,
+            "image_cache_size": 1024,
+            "image_cache_ttl": 30,
+            "recognize_cache_ttl": 0,
+            "watch_mode": "",
+            "watch_debounce": 60,
+            "fresh_run": False,
+            "recent_only": False,
+            "plan_only": False,
+            "priority": False,
+            "time_budget": 0,
             "err_hosts": ""
         }
 
     def get_page(self) -> List[dict]:
-        pass
+        """
+        拼装插件详情页面，展示最近一次运行的统计和历史运行记录
+        """
+        run_stats = self.get_data("run_stats") or []
+        plan = self.get_data("scrape_plan") or {}
+        if not run_stats and not plan:
+            return [{
+                'component': 'div',
+                'text': '暂无数据',
+                'props': {'class': 'text-center'}
+            }]
+        latest = run_stats[-1] if run_stats else {}
+
+        def __ratio(value: Optional[float]) -> str:
+            return f"{value * 100:.1f}%" if value is not None else "-"
+
+        def __card(title: str, value: str) -> dict:
+            return {
+                'component': 'VCol',
+                'props': {'cols': 6, 'md': 4},
+                'content': [{
+                    'component': 'VCard',
+                    'props': {'variant': 'tonal'},
+                    'content': [{
+                        'component': 'VCardText',
+                        'content': [
+                            {'component': 'div', 'props': {'class': 'text-caption'}, 'text': title},
+                            {'component': 'div', 'props': {'class': 'text-h6'}, 'text': value},
+                        ]
+                    }]
+                }]
+            }
+
+        def __table(title: str, headers: List[str], rows: List[List[Any]]) -> dict:
+            return {
+                'component': 'VCol',
+                'props': {'cols': 12},
+                'content': [{
+                    'component': 'VCard',
+                    'props': {'variant': 'flat'},
+                    'content': [
+                        {'component': 'VCardTitle', 'text': title},
+                        {
+                            'component': 'VTable',
+                            'props': {'hover': True, 'density': 'compact'},
+                            'content': [
+                                {
+                                    'component': 'thead',
+                                    'content': [{
+                                        'component': 'tr',
+                                        'content': [{'component': 'th', 'text': header} for header in headers]
+                                    }]
+                                },
+                                {
+                                    'component': 'tbody',
+                                    'content': [{
+                                        'component': 'tr',
+                                        'content': [{'component': 'td', 'text': str(cell)} for cell in row]
+                                    } for row in rows]
+                                }
+                            ]
+                        }
+                    ]
+                }]
+            }
+
+        content = []
+        if latest:
+            cache = latest.get("cache") or {}
+            stages = latest.get("stages") or {}
+            counters = latest.get("counters") or {}
+            # 复用次数乘以平均创建耗时，估算复用处理链节省的时间
+            chain_init = stages.get("chain_init") or {}
+            chain_saved = counters.get("chain_reused", 0) * chain_init.get("total", 0) \
+                / max(chain_init.get("count", 0), 1)
+            content = [
+                __card('处理目录', str(latest.get("directories", 0))),
+                __card('吞吐量（目录/分钟）', str(latest.get("throughput", 0))),
+                __card('运行耗时', f"{latest.get('duration', 0)}秒"),
+                __card('下载流量', StringUtils.str_filesize(latest.get("bytes_downloaded", 0))),
+                __card('识别缓存命中率', __ratio(cache.get("recognize"))),
+                __card('图片缓存命中率', __ratio(cache.get("image"))),
+                __card('nfo缓存命中率', __ratio(cache.get("nfo"))),
+                __card('跳过目录', str(counters.get("unchanged", 0) + counters.get("stale", 0))),
+                __card('处理链复用', f"{counters.get('chain_reused', 0)}次，约节省{chain_saved:.2f}秒"),
+                __table('各阶段耗时（秒）', ['阶段', '次数', '总耗时', 'P50', 'P95'],
+                        [[stage.get("name"), stage.get("count"), stage.get("total"),
+                          stage.get("p50"), stage.get("p95")] for stage in stages.values()]),
+                __table('最慢的目录', ['目录', '耗时（秒）'],
+                        [[item.get("path"), item.get("seconds")] for item in latest.get("slowest") or []]),
+                __table('最近运行', ['开始时间', '耗时（秒）', '目录数', '目录/分钟', '下载流量'],
+                        [[datetime.fromtimestamp(stats.get("started", 0)).strftime("%Y-%m-%d %H:%M:%S"),
+                          stats.get("duration"), stats.get("directories"), stats.get("throughput"),
+                          StringUtils.str_filesize(stats.get("bytes_downloaded", 0))]
+                         for stats in reversed(run_stats)]),
+            ]
+        if plan:
+            content.append(self.__plan_table(plan, __table))
+        return [{
+            'component': 'VRow',
+            'content': content
+        }]
+
+    @staticmethod
+    def __plan_table(plan: Dict[str, Any], table: Callable[[str, List[str], List[List[Any]]], dict]) -> dict:
+        """
+        刮削计划表格
+        """
+        created = datetime.fromtimestamp(plan.get("created", 0)).strftime("%Y-%m-%d %H:%M:%S")
+        nfo = plan.get("nfo") or {}
+        images = plan.get("images") or {}
+        skipped = plan.get("skipped") or {}
+        rows = [
+            ['目录', plan.get("directories", 0)],
+            ['跳过目录', sum(skipped.values())],
+            ['媒体文件', plan.get("media_files", 0)],
+            ['需生成nfo', nfo.get("render", 0)],
+            *[[f'缺失nfo：{kind}', count] for kind, count in (nfo.get("missing") or {}).items()],
+            *[[f'缺失图片（至少）：{kind}', count] for kind, count in (images.get("missing") or {}).items()],
+            *[[f'上游请求：{name}', count] for name, count in (plan.get("upstream") or {}).items()],
+            ['预计下载（至少）', StringUtils.str_filesize(plan.get("bytes", 0))],
+        ]
+        return table(f'刮削计划（{created}）', ['项目', '数量'], rows)
+
+    def __save_stats(self, summary: Dict[str, Any]):
+        """
+        保存本次运行的统计，只保留最近几次
+        """
+        run_stats = self.get_data("run_stats") or []
+        run_stats.append(summary)
+        self.save_data("run_stats", run_stats[-self._stats_history:])
+        logger.info(f"本次运行耗时 {summary.get('duration')} 秒，处理 {summary.get('directories')} 个目录，"
+                    f"下载 {StringUtils.str_filesize(summary.get('bytes_downloaded', 0))}")
 
     def __libraryscraper(self):
         """
@@ -316,111 +955,366 @@ class LibraryScraperOwn(_PluginBase):
         # 排除目录
         exclude_paths = self._exclude_paths.split("\n")
         # 已选择的目录
-        paths = self._scraper_paths.split("\n")
-        # 需要适削的媒体文件夹
-        scraper_paths = []
-        for path in paths:
-            if not path:
+        roots = LibraryDiscovery.parse_paths(self._scraper_paths)
+        discovery = LibraryDiscovery(exclude_paths=exclude_paths, event=self._event)
+        if self._plan_only:
+            # 计划按完整运行估算，不读取也不修改断点
+            with self._run_lock:
+                self.__plan(discovery.discover(roots))
+            return
+        with self._run_lock:
+            checkpoint = RunCheckpoint(self.get_data_path() / "scraper.db")
+            requests = PriorityRequests(self.get_data_path() / "scraper.db") if self._priority else None
+            # 到达时长上限后不再开始新的目录，未完成的目录保留在断点中
+            deadline = time.time() + self._time_budget * 60 if self._time_budget else None
+            try:
+                if self._fresh_run:
+                    logger.info("忽略上次运行断点，重新开始刮削")
+                    checkpoint.clear()
+                    self._fresh_run = False
+                    self.__update_config()
+                completed = checkpoint.completed()
+                pending = checkpoint.pending()
+                if completed or pending:
+                    logger.info(f"从上次中断处继续刮削，已完成 {len(completed)} 个目录，"
+                                f"待完成 {len(pending)} 个目录")
+                media_dirs = self.__resume(discovery, roots, completed, pending)
+                if requests:
+                    scheduler = PriorityScheduler(requests=requests, dateadded=self.__latest_dateadded,
+                                                  event=self._event)
+                    media_dirs = scheduler.order(media_dirs)
+                if self.__run(media_dirs, checkpoint=checkpoint, deadline=deadline):
+                    # 完整运行结束，清除断点
+                    checkpoint.clear()
+            finally:
+                if requests:
+                    requests.close()
+                checkpoint.close()
+
+    @staticmethod
+    def __resume(discovery: LibraryDiscovery, roots: List[Tuple[Path, Optional[MediaType]]],
+                 completed: Set[Tuple[str, str]], pending: List[Tuple[str, str]]) -> Iterator[MediaDir]:
+        """
+        先产出上次运行中断时未完成的目录，再继续遍历并跳过已完成的目录
+        """
+        resumed = set()
+        for path, mtype in pending:
+            media_path = Path(path)
+            if not media_path.exists():
                 continue
-            # 强制指定该路径媒体类型
-            mtype = None
-            if str(path).count("#") == 1:
-                mtype = next(
-                    (mediaType for mediaType in MediaType.__members__.values() if
-                     mediaType.value == str(str(path).split("#")[1])),
-                    None)
-                path = str(path).split("#")[0]
-            # 判断路径是否存在
-            scraper_path = Path(path)
-            if not scraper_path.exists():
-                logger.warning(f"媒体库刮削路径不存在：{path}")
+            resumed.add((path, mtype))
+            yield MediaDir(path=media_path, mtype=MediaType(mtype) if mtype else None,
+                           files=list(discovery.walk(media_path)))
+        for media_dir in discovery.discover(roots):
+            key = (str(media_dir.path), media_dir.mtype.value if media_dir.mtype else "")
+            if key in completed or key in resumed:
                 continue
-            logger.info(f"开始检索目录：{path} {mtype} ...")
-            # 遍历所有文件
-            files = SystemUtils.list_files(scraper_path, settings.RMT_MEDIAEXT)
-            for file_path in files:
+            yield media_dir
+
+    def __scrape_media_dirs(self, media_dirs: Iterable[MediaDir]):
+        """
+        刮削媒体目录，media_dirs可以是边遍历边产出的生成器
+        """
+        if self._plan_only:
+            # 只生成刮削计划时不写入媒体库
+            return
+        with self._run_lock:
+            self.__run(media_dirs)
+
+    def __run(self, media_dirs: Iterable[MediaDir], checkpoint: RunCheckpoint = None,
+              deadline: Optional[float] = None) -> bool:
+        """
+        创建本次运行共用的索引、缓存和下载器，并发刮削媒体目录
+        :param media_dirs: 需要刮削的媒体目录
+        :param checkpoint: 运行断点，记录目录的提交和完成状态
+        :param deadline: 停止开始新目录的时间戳，为空时不限制
+        :return: 是否完整运行结束，未被中断
+        """
+        self._metrics = RunMetrics()
+        scan_index = ScanIndex(self.get_data_path() / "scraper.db")
+        image_cache = ImageCache(cache_dir=self.get_data_path() / "images",
+                                 max_size=self._image_cache_size * 1024 * 1024,
+                                 ttl=self._image_cache_ttl * 86400) if self._image_cache else None
+        self._host_guard = HostGuard(rate=self._host_rate)
+        self._retry_queue = RetryQueue(self.get_data_path() / "scraper.db")
+        self._downloader = ImageDownloader(max_inflight=self._image_workers, event=self._event,
+                                           cache=image_cache, guard=self._host_guard, metrics=self._metrics)
+        recognize_store = RecognizeStore(self.get_data_path() / "scraper.db") \
+            if self._recognize_cache_ttl else None
+        if recognize_store:
+            recognize_store.purge()
+        self._recognize_cache = RecognizeCache(store=recognize_store,
+                                               ttl=self._recognize_cache_ttl * 86400)
+        self._nfo_cache = NfoCache(self.get_data_path() / "scraper.db", metrics=self._metrics)
+        self._writer = MetadataWriter(self.storagechain, metrics=self._metrics)
+        self._run_context = RunContext(metrics=self._metrics)
+        self._season_prefetch = SeasonPrefetch(tmdbchain=lambda: self._run_context.tmdbchain, request=self.__tmdb)
+        if not settings.SCRAP_FOLLOW_TMDB and checkpoint:
+            # 完整运行时按提交的目录批量查询整理记录，监控触发的少量目录逐个查询
+            self._transfer_titles = TransferTitles(metrics=self._metrics)
+        # 发现的媒体目录数
+        dir_count = 0
+        # 不在近期范围内跳过的目录数
+        stale_count = 0
+        # 是否到达运行时长上限
+        timed_out = False
+        try:
+            # 优先重试上次下载失败的图片
+            self.__drain_retry_queue()
+            with ThreadPoolExecutor(max_workers=max(1, self._max_workers),
+                                    thread_name_prefix="LibraryScraperOwn") as executor:
+                futures = set()
+                # 边遍历边刮削，在途任务数达到上限时暂停遍历
+                for media_dir in self._metrics.timed_iter("walk", media_dirs):
+                    if self._event.is_set():
+                        break
+                    if deadline and time.time() >= deadline:
+                        timed_out = True
+                        break
+                    # 识别之前先按修改时间和nfo添加时间过滤
+                    if self._recent_only and not media_dir.requested and not self.__is_recent_dir(media_dir):
+                        stale_count += 1
+                        self._metrics.incr("stale")
+                        continue
+                    dir_count += 1
+                    if len(futures) >= max(1, self._max_workers) * 2:
+                        _, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    if checkpoint:
+                        checkpoint.mark(media_dir.path, media_dir.mtype.value if media_dir.mtype else None,
+                                        done=False)
+                    if self._transfer_titles:
+                        record = scan_index.get(media_dir.path)
+                        if record and record.tmdbid:
+                            self._transfer_titles.want(media_dir.path, record.tmdbid)
+                    futures.add(executor.submit(self.__scrape_task, media_dir.path, media_dir.mtype,
+                                                media_dir.files, scan_index, checkpoint, media_dir.requested))
+                if self._event.is_set() or timed_out:
+                    if timed_out:
+                        logger.info(f"已到达单次运行时长上限 {self._time_budget} 分钟，剩余目录下次运行继续")
+                    else:
+                        logger.info(f"媒体库刮削服务停止")
+                    # 取消尚未开始的目录，正在刮削的目录完成后退出
+                    for future in futures:
+                        future.cancel()
+                wait(futures)
+            # 等待后台图片下载完成
+            self._downloader.join()
+        finally:
+            self._downloader.close()
+            self._downloader = None
+            if image_cache:
+                image_cache.close()
+            self._recognize_cache = None
+            if recognize_store:
+                recognize_store.close()
+            nfo_cache, self._nfo_cache = self._nfo_cache, None
+            nfo_cache.close()
+            scan_index.close()
+            writer, self._writer = self._writer, None
+            self._season_prefetch = None
+            self._run_context = None
+            self._transfer_titles = None
+            self._host_guard = None
+            retry_queue, self._retry_queue = self._retry_queue, None
+            retry_queue.close()
+            metrics, self._metrics = self._metrics, None
+            metrics.finished = time.time()
+            if dir_count:
+                self.__save_stats(metrics.summary())
+        if stale_count:
+            logger.info(f"{stale_count} 个目录近{self._pre_day}天内没有变化，已跳过")
+        if not dir_count:
+            logger.info(f"未发现需要刮削的目录")
+        elif writer.written or writer.skipped:
+            logger.info(f"本次共写入 {writer.written} 个文件，内容未变化跳过 {writer.skipped} 个文件")
+        return not self._event.is_set() and not timed_out
+
+    def __plan(self, media_dirs: Iterable[MediaDir]):
+        """
+        生成刮削计划：按与刮削相同的规则跳过目录，只检查文件是否存在和查询识别缓存，不请求上游也不写入媒体库
+        """
+        plan = ScrapePlan(overwrite=bool(self._mode),
+                          image_size=average_image_size(self.get_data("run_stats"), self._default_image_size),
+                          timed_out=lambda path: bool(self.__check_time_out(path, self._pre_day)))
+        scan_index = ScanIndex(self.get_data_path() / "scraper.db")
+        recognize_store = RecognizeStore(self.get_data_path() / "scraper.db") \
+            if self._recognize_cache_ttl else None
+        self._nfo_cache = NfoCache(self.get_data_path() / "scraper.db")
+        logger.info("开始生成刮削计划 ...")
+        try:
+            for media_dir in media_dirs:
                 if self._event.is_set():
                     logger.info(f"媒体库刮削服务停止")
                     return
-                # 排除目录
-                exclude_flag = False
-                for exclude_path in exclude_paths:
-                    try:
-                        if file_path.is_relative_to(Path(exclude_path)):
-                            exclude_flag = True
-                            break
-                    except Exception as err:
-                        print(str(err))
-                if exclude_flag:
-                    logger.debug(f"{file_path} 在排除目录中，跳过 ...")
-                    continue
-                # 识别是电影还是电视剧
-                if not mtype:
-                    file_meta = MetaInfoPath(file_path)
-                    mtype = file_meta.type
-                # 重命名格式
-                rename_format = settings.TV_RENAME_FORMAT \
-                    if mtype == MediaType.TV else settings.MOVIE_RENAME_FORMAT
-                # 计算重命名中的文件夹层数
-                rename_format_level = len(rename_format.split("/")) - 1
-                if rename_format_level < 1:
+                if self._recent_only and not self.__is_recent_dir(media_dir):
+                    plan.skip("stale")
                     continue
-                # 取相对路径的第1层目录
-                media_path = file_path.parents[rename_format_level - 1]
-                dir_item = (media_path, mtype)
-                if dir_item not in scraper_paths:
-                    logger.info(f"发现目录：{dir_item}")
-                    scraper_paths.append(dir_item)
-        # 开始刮削
-        if scraper_paths:
-            for item in scraper_paths:
-                logger.info(f"开始刮削目录：{item[0]} ...")
-                self.__scrape_dir(path=item[0], mtype=item[1])
-        else:
-            logger.info(f"未发现需要刮削的目录")
+                mtype_value = media_dir.mtype.value if media_dir.mtype else None
+                if self._incremental:
+                    fingerprint = DirFingerprint.from_files(media_dir.files)
+                    if not self.__is_recent(fingerprint.mtime, self._pre_day) \
+                            and scan_index.is_unchanged(media_dir.path, mtype_value, fingerprint):
+                        plan.skip("unchanged")
+                        continue
+                self.__plan_dir(plan, media_dir, recognize_store)
+        finally:
+            nfo_cache, self._nfo_cache = self._nfo_cache, None
+            nfo_cache.close()
+            if recognize_store:
+                recognize_store.close()
+            scan_index.close()
+        summary = plan.summary()
+        self.save_data("scrape_plan", summary)
+        logger.info(f"刮削计划生成完成：{summary['directories']} 个目录，需生成 {summary['nfo']['render']} 个nfo，"
+                    f"至少下载 {summary['images']['download']} 张图片，"
+                    f"至少 {StringUtils.str_filesize(summary['bytes'])}，"
+                    f"上游请求约 {sum(summary['upstream'].values())} 次")
+
+    def __plan_dir(self, plan: ScrapePlan, media_dir: MediaDir, recognize_store: Optional[RecognizeStore]):
+        """
+        估算一个媒体目录的刮削工作量
+        """
+        key, _ = self.__dir_recognition(media_dir.path, media_dir.mtype)
+        mediainfo = recognize_store.get(key) if recognize_store else None
+        plan.recognize(mediainfo is not None)
+        if media_dir.mtype == MediaType.MOVIE:
+            plan.movie(media_dir)
+            return
+
+        def __season_cached(season: int) -> bool:
+            if not mediainfo or not recognize_store:
+                return False
+            return recognize_store.get(RecognizeCache.key(mediainfo.tmdb_id, MediaType.TV,
+                                                          season, mediainfo.episode_group)) is not None
+
+        plan.tv(media_dir, season_cached=__season_cached)
+
+    def __drain_retry_queue(self):
+        """
+        重新下载上次运行失败的图片，成功后移出重试队列，失败时累加失败次数
+        """
+        retry_queue = self._retry_queue
+        items = retry_queue.items()
+        if not items:
+            return
+        logger.info(f"开始重试上次下载失败的 {len(items)} 张图片 ...")
+        for item in items:
+            if self._event.is_set():
+                return
+            dir_path = Path(item.dir_path)
+            if self.storagechain.get_file_item(storage=item.storage, path=dir_path / item.name):
+                retry_queue.remove(item)
+                continue
+            dir_item = self.storagechain.get_file_item(storage=item.storage, path=dir_path)
+            if not dir_item:
+                retry_queue.remove(item)
+                continue
+
+            def __on_success(_content: bytes, _item: RetryItem = item, _dir_item: schemas.FileItem = dir_item):
+                if self._writer.save(fileitem=_dir_item, name=_item.name, content=_content):
+                    retry_queue.remove(_item)
+
+            self._downloader.submit(item.url, callback=__on_success,
+                                    on_failure=lambda _item=item: retry_queue.push(_item))
+        self._downloader.join()
+
+    def __scrape_task(self, media_path: Path, mtype: Optional[MediaType], media_files: List[Path],
+                      scan_index: ScanIndex, checkpoint: RunCheckpoint = None, requested: List[Path] = None):
+        """
+        在线程池中刮削一个媒体目录
+        :param requested: 匹配该目录的优先刮削路径，不按增量索引跳过，刮削完成后移除
+        """
+        if self._event.is_set():
+            return
+        mtype_value = mtype.value if mtype else None
+        fingerprint = DirFingerprint.from_files(media_files)
+        if self._incremental and not requested \
+                and not self.__is_recent(fingerprint.mtime, self._pre_day) \
+                and scan_index.is_unchanged(media_path, mtype_value, fingerprint):
+            logger.debug(f"{media_path} 自上次刮削后未发生变化，跳过")
+            if self._metrics:
+                self._metrics.incr("unchanged")
+            if self._transfer_titles:
+                self._transfer_titles.drop(media_path)
+            self.__complete_dir(media_path, mtype_value, checkpoint, requested)
+            return
+        logger.info(f"开始刮削目录：{media_path} ...")
+        begin = time.perf_counter()
+        metrics = self._metrics
+        # 上游暂停请求中，未能识别或获取图片
+        blocked = False
+        with self._downloader.group() as downloads:
+            try:
+                state = self.__scrape_dir(path=media_path, mtype=mtype)
+            except HostBlocked as err:
+                logger.warn(f"{err} 暂停请求中，{media_path} 下次运行继续")
+                state = None
+                blocked = True
+            except Exception as err:
+                logger.error(f"{media_path} 刮削失败：{str(err)}")
+                state = None
+
+        def __finish():
+            if metrics:
+                metrics.directory(str(media_path), time.perf_counter() - begin)
+            # 中途停止的目录保持未完成状态，下次继续
+            if self._event.is_set() or blocked:
+                return
+            if state and state.failures:
+                # 有文件未生成时不记录索引，保持未完成状态，下次运行重新刮削
+                logger.warn(f"{media_path} 有 {len(state.failures)} 个文件生成失败，下次运行重试")
+                return
+            if state:
+                scan_index.update(media_path, mtype_value, fingerprint, state.mediainfo.tmdb_id)
+            self.__complete_dir(media_path, mtype_value, checkpoint, requested)
+
+        # 该目录的图片在后台下载完成后再记录索引和断点，未下载的图片已加入重试队列，线程继续刮削下一个目录
+        downloads.then(__finish)
+
+    def __complete_dir(self, media_path: Path, mtype_value: Optional[str],
+                       checkpoint: Optional[RunCheckpoint], requested: Optional[List[Path]]):
+        """
+        记录目录已完成，移除对应的优先刮削路径
+        """
+        if checkpoint:
+            checkpoint.mark(media_path, mtype_value, done=True)
+        if requested:
+            requests = PriorityRequests(self.get_data_path() / "scraper.db")
+            try:
+                for path in requested:
+                    requests.remove(path)
+            finally:
+                requests.close()
+        if self._metrics:
+            self._metrics.incr("directories")
 
-    def __scrape_dir(self, path: Path, mtype: MediaType):
+    def __scrape_dir(self, path: Path, mtype: MediaType) -> Optional[ScrapeState]:
         """
         削刮一个目录，该目录必须是媒体文件目录
+        :return: 本次刮削的状态，未识别到媒体信息时返回None
         """
-        # 优先读取本地nfo文件
-        tmdbid = None
-        if mtype == MediaType.MOVIE:
-            # 电影
-            movie_nfo = path / "movie.nfo"
-            if movie_nfo.exists():
-                tmdbid = self.__get_tmdbid_from_nfo(movie_nfo)
-            file_nfo = path / (path.stem + ".nfo")
-            if not tmdbid and file_nfo.exists():
-                tmdbid = self.__get_tmdbid_from_nfo(file_nfo)
-        else:
-            # 电视剧
-            tv_nfo = path / "tvshow.nfo"
-            if tv_nfo.exists():
-                tmdbid = self.__get_tmdbid_from_nfo(tv_nfo)
-        if tmdbid:
-            # 按TMDBID识别
-            logger.info(f"读取到本地nfo文件的tmdbid：{tmdbid}")
-            mediainfo = self.chain.recognize_media(tmdbid=tmdbid, mtype=mtype)
-        else:
-            # 按名称识别
-            meta = MetaInfoPath(path)
-            meta.type = mtype
-            mediainfo = self.chain.recognize_media(meta=meta)
+        key, loader = self.__dir_recognition(path, mtype)
+        mediainfo = self.__recognize(key=key, loader=loader)
         if not mediainfo:
             logger.warn(f"未识别到媒体信息：{path}")
-            return
+            return None
 
         # 如果未开启新增已入库媒体是否跟随TMDB信息变化则根据tmdbid查询之前的title
         if not settings.SCRAP_FOLLOW_TMDB:
-            transfer_history = TransferHistoryOper().get_by_type_tmdbid(tmdbid=mediainfo.tmdb_id,
-                                                                        mtype=mediainfo.type.value)
-            if transfer_history:
-                mediainfo.title = transfer_history.title
+            transfer_titles = self._transfer_titles
+            if transfer_titles:
+                title = transfer_titles.get(tmdbid=mediainfo.tmdb_id, mtype=mediainfo.type.value)
+            else:
+                transfer_history = TransferHistoryOper().get_by_type_tmdbid(tmdbid=mediainfo.tmdb_id,
+                                                                            mtype=mediainfo.type.value)
+                title = transfer_history.title if transfer_history else None
+            if title:
+                mediainfo.title = title
         # 获取图片
-        self.chain.obtain_images(mediainfo)
+        with timer(self._metrics, "obtain_images"):
+            self.__tmdb(lambda: self.chain.obtain_images(mediainfo))
 
-        self.scrape_metadata(
+        state = self.scrape_metadata(
             fileitem=schemas.FileItem(
                 storage="local",
                 type="dir",
@@ -433,79 +1327,53 @@ class LibraryScraperOwn(_PluginBase):
             overwrite=True if self._mode else False
         )
         logger.info(f"{path} 刮削完成")
+        return state
+
+    def __dir_recognition(self, path: Path,
+                          mtype: MediaType) -> Tuple[str, Callable[[], Optional[MediaInfo]]]:
+        """
+        媒体目录的识别方式，优先读取本地nfo文件中的tmdbid，没有时按目录名识别
+        :return: 识别缓存键, 识别方法
+        """
+        tmdbid = None
+        if mtype == MediaType.MOVIE:
+            # 电影
+            movie_nfo = path / "movie.nfo"
+            if movie_nfo.exists():
+                tmdbid = self.__get_tmdbid_from_nfo(movie_nfo)
+            file_nfo = path / (path.stem + ".nfo")
+            if not tmdbid and file_nfo.exists():
+                tmdbid = self.__get_tmdbid_from_nfo(file_nfo)
+        else:
+            # 电视剧
+            tv_nfo = path / "tvshow.nfo"
+            if tv_nfo.exists():
+                tmdbid = self.__get_tmdbid_from_nfo(tv_nfo)
+        if tmdbid:
+            # 按TMDBID识别
+            logger.info(f"读取到本地nfo文件的tmdbid：{tmdbid}")
+            return RecognizeCache.key(tmdbid, mtype), \
+                lambda: self.chain.recognize_media(tmdbid=tmdbid, mtype=mtype)
+        # 按名称识别
+        meta = MetaInfoPath(path)
+        meta.type = mtype
+        return RecognizeCache.key("name", meta.name, meta.year, mtype), \
+            lambda: self.chain.recognize_media(meta=meta)
 
     def scrape_metadata(self, fileitem: schemas.FileItem,
                         meta: MetaBase = None, mediainfo: MediaInfo = None,
                         init_folder: bool = True, parent: schemas.FileItem = None,
-                        overwrite: bool = False):
+                        overwrite: bool = False) -> Optional[ScrapeState]:
         """
-        手动刮削媒体信息
+        手动刮削媒体信息，按工作队列逐层处理目录，nfo和图片作为独立任务调度
         :param fileitem: 刮削目录或文件
         :param meta: 元数据
         :param mediainfo: 媒体信息
         :param init_folder: 是否刮削根目录
         :param parent: 上级目录
         :param overwrite: 是否覆盖已有文件
+        :return: 本次刮削的状态，未刮削时返回None，后台下载的图片完成前失败列表可能继续增加
         """
-
-        def is_bluray_folder(_fileitem: schemas.FileItem) -> bool:
-            """
-            判断是否为原盘目录
-            """
-            if not _fileitem or _fileitem.type != "dir":
-                return False
-            # 蓝光原盘目录必备的文件或文件夹
-            required_files = ['BDMV', 'CERTIFICATE']
-            # 检查目录下是否存在所需文件或文件夹
-            for item in self.storagechain.list_files(_fileitem):
-                if item.name in required_files:
-                    return True
-            return False
-
-        def __list_files(_fileitem: schemas.FileItem):
-            """
-            列出下级文件
-            """
-            return self.storagechain.list_files(fileitem=_fileitem)
-
-        def __save_file(_fileitem: schemas.FileItem, _path: Path, _content: Union[bytes, str]):
-            """
-            保存或上传文件
-            :param _fileitem: 关联的媒体文件项
-            :param _path: 元数据文件路径
-            :param _content: 文件内容
-            """
-            if not _fileitem or not _content or not _path:
-                return
-            # 保存文件到临时目录，文件名随机
-            tmp_file = settings.TEMP_PATH / f"{_path.name}.{StringUtils.generate_random_str(10)}"
-            tmp_file.write_bytes(_content)
-            # 获取文件的父目录
-            try:
-                item = self.storagechain.upload_file(fileitem=_fileitem, path=tmp_file, new_name=_path.name)
-                if item:
-                    logger.info(f"已保存文件：{item.path}")
-                else:
-                    logger.warn(f"文件保存失败：{_path}")
-            finally:
-                if tmp_file.exists():
-                    tmp_file.unlink()
-
-        def __download_image(_url: str) -> Optional[bytes]:
-            """
-            下载图片并保存
-            """
-            try:
-                logger.info(f"正在下载图片：{_url} ...")
-                r = RequestUtils(proxies=settings.PROXY).get_res(url=_url)
-                if r:
-                    return r.content
-                else:
-                    logger.info(f"{_url} 图片下载失败，请检查网络连通性！")
-            except Exception as err:
-                logger.error(f"{_url} 图片下载失败：{str(err)}！")
-            return None
-
         # 当前文件路径
         filepath = Path(fileitem.path)
         if fileitem.type == "file" \
@@ -514,290 +1382,524 @@ class LibraryScraperOwn(_PluginBase):
         if not meta:
             meta = MetaInfoPath(filepath)
         if not mediainfo:
-            mediainfo = MediaChain().recognize_by_meta(meta)
+            mediainfo = self.__mediachain().recognize_by_meta(meta)
         if not mediainfo:
             logger.warn(f"{filepath} 无法识别文件媒体信息！")
             return
         logger.info(f"开始刮削：{filepath} ...")
-        if mediainfo.type == MediaType.MOVIE:
-            # 电影
-            if fileitem.type == "file":
-                # 是否已存在
-                nfo_path = filepath.with_suffix(".nfo")
-                if self.__check_time_out(nfo_path, self._pre_day):
-                    logger.info(f"超过{self._pre_day}天跳过：{nfo_path}")
-                    return
-
-                if overwrite or not self.storagechain.get_file_item(storage=fileitem.storage, path=nfo_path):
-                    # 电影文件
-                    movie_nfo = MediaChain().metadata_nfo(meta=meta, mediainfo=mediainfo)
-                    if movie_nfo:
-                        # 保存或上传nfo文件到上级目录
-                        __save_file(_fileitem=parent, _path=nfo_path, _content=movie_nfo)
-                    else:
-                        logger.warn(f"{filepath.name} nfo文件生成失败！")
+        state = ScrapeState(meta=meta, mediainfo=mediainfo, overwrite=overwrite,
+                            listing=DirListing(self.storagechain, metrics=self._metrics),
+                            writer=self._writer or MetadataWriter(self.storagechain))
+        # 后进先出，子项处理完后才执行目录自身的任务，队列长度不超过层数乘以每页子项数
+        queue: List[ScrapeTask] = [
+            DirFrame(fileitem=fileitem, parent=parent, init_folder=init_folder) if fileitem.type == "dir"
+            else FileTask(fileitem=fileitem, parent=parent)
+        ]
+        while queue:
+            if self._event.is_set():
+                logger.info(f"媒体库刮削服务停止")
+                return state
+            task = queue.pop()
+            try:
+                if isinstance(task, DirFrame):
+                    tasks = self.__expand_dir(state, task)
+                elif isinstance(task, FileTask):
+                    tasks = self.__scrape_file(state, task)
+                elif isinstance(task, NfoTask):
+                    self.__run_nfo_task(state, task)
+                    continue
+                elif isinstance(task, ImageTask):
+                    self.__run_image_task(state, task)
+                    continue
                 else:
-                    logger.info(f"已存在nfo文件：{nfo_path}")
-            else:
-                # 电影目录
-                if is_bluray_folder(fileitem):
-                    # 原盘目录
-                    nfo_path = filepath / (filepath.name + ".nfo")
-                    if self.__check_time_out(nfo_path, self._pre_day):
-                        logger.info(f"超过{self._pre_day}天跳过：{nfo_path}")
-                        return
-                    if overwrite or not self.storagechain.get_file_item(storage=fileitem.storage, path=nfo_path):
-                        # 生成原盘nfo
-                        movie_nfo = MediaChain().metadata_nfo(meta=meta, mediainfo=mediainfo)
-                        if movie_nfo:
-                            # 保存或上传nfo文件到当前目录
-                            __save_file(_fileitem=fileitem, _path=nfo_path, _content=movie_nfo)
-                        else:
-                            logger.warn(f"{filepath.name} nfo文件生成失败！")
-                    else:
-                        logger.info(f"已存在nfo文件：{nfo_path}")
+                    state.listing.release(task.fileitem)
+                    continue
+            except Exception as err:
+                # 跳过或出错的任务记为失败，目录不记录索引，下次运行重新刮削
+                task_path = task.path if isinstance(task, (NfoTask, ImageTask)) else Path(task.fileitem.path)
+                if isinstance(err, HostBlocked):
+                    logger.warn(f"{err} 暂停请求中，跳过：{task_path}")
                 else:
-                    # 处理目录内的文件
-                    files = __list_files(_fileitem=fileitem)
-                    for file in files:
-                        self.scrape_metadata(fileitem=file,
-                                             meta=meta, mediainfo=mediainfo,
-                                             init_folder=False, parent=fileitem,
-                                             overwrite=overwrite)
-                # 生成目录内图片文件
-                if init_folder:
-                    # 图片
-                    for attr_name, attr_value in vars(mediainfo).items():
-                        if attr_value \
-                                and attr_name.endswith("_path") \
-                                and attr_value \
-                                and isinstance(attr_value, str) \
-                                and attr_value.startswith("http"):
-                            image_name = attr_name.replace("_path", "") + Path(attr_value).suffix
-                            image_path = filepath / image_name
-                            if not self.storagechain.get_file_item(storage=fileitem.storage,
-                                                                                path=image_path):
-                                # 下载图片
-                                content = __download_image(_url=attr_value)
-                                # 写入图片到当前目录
-                                if content:
-                                    __save_file(_fileitem=fileitem, _path=image_path, _content=content)
-                            else:
-                                logger.info(f"已存在图片文件：{image_path}")
-        else:
-            # 电视剧
-            if fileitem.type == "file":
-                # 重新识别季集
-                file_meta = MetaInfoPath(filepath)
-                if not file_meta.begin_episode:
-                    logger.warn(f"{filepath.name} 无法识别文件集数！")
-                    return
-                file_mediainfo = MediaChain().recognize_media(meta=file_meta, tmdbid=mediainfo.tmdb_id,
-                                                      episode_group=mediainfo.episode_group)
-                if not file_mediainfo:
-                    logger.warn(f"{filepath.name} 无法识别文件媒体信息！")
-                    return
-                # 是否已存在
-                nfo_path = filepath.with_suffix(".nfo")
-
-                if self.__check_time_out(nfo_path, self._pre_day):
-                    logger.info(f"超过{self._pre_day}天跳过：{nfo_path}")
-                    return
+                    logger.error(f"{task_path} 刮削失败：{str(err)}")
+                state.failures.append(task_path)
+                continue
+            # 任务按执行顺序返回，倒序入栈
+            queue.extend(reversed(tasks))
+        logger.info(f"{filepath.name} 刮削完成")
+        return state
 
-                if overwrite or not self.storagechain.get_file_item(storage=fileitem.storage, path=nfo_path):
-                    # 获取集的nfo文件
-                    episode_nfo = MediaChain().metadata_nfo(meta=file_meta, mediainfo=file_mediainfo,
-                                                    season=file_meta.begin_season,
-                                                    episode=file_meta.begin_episode)
-                    if episode_nfo:
-                        # 保存或上传nfo文件到上级目录
-                        if not parent:
-                            parent = self.storagechain.get_parent_item(fileitem)
-                        __save_file(_fileitem=parent, _path=nfo_path, _content=episode_nfo)
-                    else:
-                        logger.warn(f"{filepath.name} nfo文件生成失败！")
+    def __expand_dir(self, state: ScrapeState, frame: DirFrame) -> List[ScrapeTask]:
+        """
+        处理一个目录层级：首次进入时安排目录自身的nfo和图片任务，之后每次取出一页子项
+        """
+        fileitem = frame.fileitem
+        filepath = Path(fileitem.path)
+        tasks: List[ScrapeTask] = []
+        # 目录自身的任务在所有子项之后执行
+        folder_tasks: List[ScrapeTask] = []
+        if frame.children is None:
+            if state.mediainfo.type == MediaType.MOVIE and self.__is_bluray_folder(state, fileitem):
+                # 原盘目录
+                folder_tasks.append(NfoTask(dir_item=fileitem, owner=None, storage=fileitem.storage,
+                                            path=filepath / (filepath.name + ".nfo"),
+                                            render=lambda: self.__metadata_nfo(meta=state.meta,
+                                                                               mediainfo=state.mediainfo),
+                                            failure=f"{filepath.name} nfo文件生成失败！"))
+                frame.children = iter(())
+            else:
+                frame.children = iter(state.listing.list(fileitem))
+            if frame.init_folder:
+                if state.mediainfo.type == MediaType.MOVIE:
+                    folder_tasks.extend(self.__movie_folder_tasks(state, fileitem))
                 else:
-                    logger.info(f"已存在nfo文件：{nfo_path}")
-                # 获取集的图片
-                image_dict = MediaChain().metadata_img(mediainfo=file_mediainfo,
-                                               season=file_meta.begin_season, episode=file_meta.begin_episode)
-                if image_dict:
-                    for episode, image_url in image_dict.items():
-                        image_path = filepath.with_suffix(Path(image_url).suffix)
-                        if not self.storagechain.get_file_item(storage=fileitem.storage, path=image_path):
-                            # 下载图片
-                            content = __download_image(image_url)
-                            # 保存图片文件到当前目录
-                            if content:
-                                if not parent:
-                                    parent = self.storagechain.get_parent_item(fileitem)
-                                __save_file(_fileitem=parent, _path=image_path, _content=content)
-                        else:
-                            logger.info(f"已存在图片文件：{image_path}")
+                    folder_tasks.extend(self.__tv_folder_tasks(state, frame))
+            folder_tasks.append(ReleaseTask(fileitem=fileitem))
+        page = list(islice(frame.children, self._page_size))
+        for child in page:
+            if child.type == "dir":
+                tasks.append(DirFrame(fileitem=child, parent=fileitem,
+                                      init_folder=state.mediainfo.type != MediaType.MOVIE))
             else:
-                # 当前为目录，处理目录内的文件
-                files = __list_files(_fileitem=fileitem)
-                for file in files:
-                    self.scrape_metadata(fileitem=file,
-                                         meta=meta, mediainfo=mediainfo,
-                                         parent=fileitem if file.type == "file" else None,
-                                         init_folder=True if file.type == "dir" else False,
-                                         overwrite=overwrite)
-                # 生成目录的nfo和图片
-                if init_folder:
-                    # 识别文件夹名称
-                    season_meta = MetaInfo(filepath.name)
-                    # 当前文件夹为Specials或者SPs时，设置为S0
-                    if filepath.name in settings.RENAME_FORMAT_S0_NAMES:
-                        season_meta.begin_season = 0
-                    if season_meta.begin_season is not None:
-                        # 是否已存在
-                        nfo_path = filepath / "season.nfo"
-                        if self.__check_time_out(nfo_path, self._pre_day):
-                            logger.info(f"超过{self._pre_day}天跳过：{nfo_path}")
-                            return
-                        if overwrite or not self.storagechain.get_file_item(storage=fileitem.storage, path=nfo_path):
-                            # 当前目录有季号，生成季nfo
-                            season_nfo = MediaChain().metadata_nfo(meta=meta, mediainfo=mediainfo,
-                                                           season=season_meta.begin_season)
-                            if season_nfo:
-                                # 写入nfo到根目录
-                                __save_file(_fileitem=fileitem, _path=nfo_path, _content=season_nfo)
-                            else:
-                                logger.warn(f"无法生成电视剧季nfo文件：{meta.name}")
-                        else:
-                            logger.info(f"已存在nfo文件：{nfo_path}")
-                        # TMDB季poster图片
-                        image_dict = MediaChain().metadata_img(mediainfo=mediainfo, season=season_meta.begin_season)
-                        if image_dict:
-                            for image_name, image_url in image_dict.items():
-                                image_path = filepath.with_name(image_name)
-                                if not self.storagechain.get_file_item(storage=fileitem.storage,
-                                                                                    path=image_path):
-                                    # 下载图片
-                                    content = __download_image(image_url)
-                                    # 保存图片文件到剧集目录
-                                    if content:
-                                        if not parent:
-                                            parent = self.storagechain.get_parent_item(fileitem)
-                                        __save_file(_fileitem=parent, _path=image_path, _content=content)
-                                else:
-                                    logger.info(f"已存在图片文件：{image_path}")
-                        # 额外fanart季图片：poster thumb banner
-                        image_dict = MediaChain().metadata_img(mediainfo=mediainfo)
-                        if image_dict:
-                            for image_name, image_url in image_dict.items():
-                                if image_name.startswith("season"):
-                                    image_path = filepath.with_name(image_name)
-                                    # 只下载当前刮削季的图片
-                                    image_season = "00" if "specials" in image_name else image_name[6:8]
-                                    if image_season != str(season_meta.begin_season).rjust(2, '0'):
-                                        logger.info(f"当前刮削季为：{season_meta.begin_season}，跳过文件：{image_path}")
-                                        continue
-                                    if not self.storagechain.get_file_item(storage=fileitem.storage,
-                                                                                        path=image_path):
-                                        # 下载图片
-                                        content = __download_image(image_url)
-                                        # 保存图片文件到当前目录
-                                        if content:
-                                            if not parent:
-                                                parent = self.storagechain.get_parent_item(fileitem)
-                                            __save_file(_fileitem=parent, _path=image_path, _content=content)
-                                    else:
-                                        logger.info(f"已存在图片文件：{image_path}")
-                    # 判断当前目录是不是剧集根目录
-                    if not season_meta.season:
-                        # 是否已存在
-                        nfo_path = filepath / "tvshow.nfo"
-                        if self.__check_time_out(nfo_path, self._pre_day):
-                            logger.info(f"超过{self._pre_day}天跳过：{nfo_path}")
-                            return
-                        if overwrite or not self.storagechain.get_file_item(storage=fileitem.storage, path=nfo_path):
-                            # 当前目录有名称，生成tvshow nfo 和 tv图片
-                            tv_nfo = MediaChain().metadata_nfo(meta=meta, mediainfo=mediainfo)
-                            if tv_nfo:
-                                # 写入tvshow nfo到根目录
-                                __save_file(_fileitem=fileitem, _path=nfo_path, _content=tv_nfo)
-                            else:
-                                logger.warn(f"无法生成电视剧nfo文件：{meta.name}")
-                        else:
-                            logger.info(f"已存在nfo文件：{nfo_path}")
-                        # 生成目录图片
-                        image_dict = MediaChain().metadata_img(mediainfo=mediainfo)
-                        if image_dict:
-                            for image_name, image_url in image_dict.items():
-                                # 不下载季图片
-                                if image_name.startswith("season"):
-                                    continue
-                                image_path = filepath / image_name
-                                if not self.storagechain.get_file_item(storage=fileitem.storage,
-                                                                                    path=image_path):
-                                    # 下载图片
-                                    content = __download_image(image_url)
-                                    # 保存图片文件到当前目录
-                                    if content:
-                                        __save_file(_fileitem=fileitem, _path=image_path, _content=content)
-                                else:
-                                    logger.info(f"已存在图片文件：{image_path}")
-        logger.info(f"{filepath.name} 刮削完成")
+                tasks.append(FileTask(fileitem=child, parent=fileitem))
+        if len(page) == self._page_size:
+            # 还有剩余子项，处理完这一页后再次进入
+            tasks.append(frame)
+        return tasks + folder_tasks
+
+    def __scrape_file(self, state: ScrapeState, task: FileTask) -> List[ScrapeTask]:
+        """
+        安排一个媒体文件的nfo和图片任务
+        """
+        fileitem = task.fileitem
+        filepath = Path(fileitem.path)
+        if not filepath.suffix or filepath.suffix.lower() not in settings.RMT_MEDIAEXT:
+            return []
+        mediainfo = state.mediainfo
+        if mediainfo.type == MediaType.MOVIE:
+            # 电影文件，nfo保存到上级目录
+            return [NfoTask(dir_item=task.parent, owner=fileitem, storage=fileitem.storage,
+                            path=filepath.with_suffix(".nfo"),
+                            render=lambda: self.__metadata_nfo(meta=state.meta, mediainfo=mediainfo),
+                            failure=f"{filepath.name} nfo文件生成失败！")]
+        # 重新识别季集
+        file_meta = MetaInfoPath(filepath)
+        if not file_meta.begin_episode:
+            logger.warn(f"{filepath.name} 无法识别文件集数！")
+            return []
+        file_mediainfo = self.__recognize_episode(mediainfo, file_meta)
+        if not file_mediainfo:
+            logger.warn(f"{filepath.name} 无法识别文件媒体信息！")
+            state.failures.append(filepath)
+            return []
+        # 获取集的nfo文件，保存到上级目录
+        tasks: List[ScrapeTask] = [
+            NfoTask(dir_item=task.parent, owner=fileitem, storage=fileitem.storage,
+                    path=filepath.with_suffix(".nfo"),
+                    render=lambda: self.__metadata_nfo(meta=file_meta, mediainfo=file_mediainfo,
+                                                       season=file_meta.begin_season,
+                                                       episode=file_meta.begin_episode),
+                    failure=f"{filepath.name} nfo文件生成失败！")
+        ]
+        # 获取集的图片
+        image_dict = self.__episode_images(mediainfo=file_mediainfo,
+                                           season=file_meta.begin_season, episode=file_meta.begin_episode)
+        if image_dict is None:
+            state.failures.append(filepath)
+        for image_url in (image_dict or {}).values():
+            tasks.append(ImageTask(dir_item=task.parent, owner=fileitem, storage=fileitem.storage,
+                                   path=filepath.with_suffix(Path(image_url).suffix), url=image_url))
+        return tasks
 
+    def __movie_folder_tasks(self, state: ScrapeState, fileitem: schemas.FileItem) -> List[ScrapeTask]:
+        """
+        电影目录的图片任务
+        """
+        filepath = Path(fileitem.path)
+        tasks: List[ScrapeTask] = []
+        for attr_name, attr_value in vars(state.mediainfo).items():
+            if attr_value \
+                    and attr_name.endswith("_path") \
+                    and isinstance(attr_value, str) \
+                    and attr_value.startswith("http"):
+                image_name = attr_name.replace("_path", "") + Path(attr_value).suffix
+                # 下载图片并写入到当前目录
+                tasks.append(ImageTask(dir_item=fileitem, owner=None, storage=fileitem.storage,
+                                       path=filepath / image_name, url=attr_value))
+        return tasks
+
+    def __tv_folder_tasks(self, state: ScrapeState, frame: DirFrame) -> List[ScrapeTask]:
+        """
+        电视剧季目录和剧集根目录的nfo和图片任务
+        """
+        fileitem = frame.fileitem
+        filepath = Path(fileitem.path)
+        meta, mediainfo = state.meta, state.mediainfo
+        tasks: List[ScrapeTask] = []
+        # 识别文件夹名称
+        season_meta = MetaInfo(filepath.name)
+        # 当前文件夹为Specials或者SPs时，设置为S0
+        if filepath.name in settings.RENAME_FORMAT_S0_NAMES:
+            season_meta.begin_season = 0
+        if season_meta.begin_season is not None:
+            season = season_meta.begin_season
+            # 当前目录有季号，生成季nfo
+            tasks.append(NfoTask(dir_item=fileitem, owner=None, storage=fileitem.storage,
+                                 path=filepath / "season.nfo",
+                                 render=lambda: self.__metadata_nfo(meta=meta, mediainfo=mediainfo, season=season),
+                                 failure=f"无法生成电视剧季nfo文件：{meta.name}"))
+            # TMDB季poster图片，保存到剧集目录
+            image_dict = self.__metadata_img(mediainfo=mediainfo, season=season)
+            if image_dict is None:
+                state.failures.append(filepath)
+            for image_name, image_url in (image_dict or {}).items():
+                tasks.append(ImageTask(dir_item=frame.parent, owner=fileitem, storage=fileitem.storage,
+                                       path=filepath.with_name(image_name), url=image_url))
+            # 额外fanart季图片：poster thumb banner
+            image_dict = self.__metadata_img(mediainfo=mediainfo)
+            if image_dict is None:
+                state.failures.append(filepath)
+            for image_name, image_url in (image_dict or {}).items():
+                if not image_name.startswith("season"):
+                    continue
+                image_path = filepath.with_name(image_name)
+                # 只下载当前刮削季的图片
+                image_season = "00" if "specials" in image_name else image_name[6:8]
+                if image_season != str(season).rjust(2, '0'):
+                    logger.info(f"当前刮削季为：{season}，跳过文件：{image_path}")
+                    continue
+                tasks.append(ImageTask(dir_item=frame.parent, owner=fileitem, storage=fileitem.storage,
+                                       path=image_path, url=image_url))
+        # 判断当前目录是不是剧集根目录
+        if not season_meta.season:
+            # 当前目录有名称，生成tvshow nfo 和 tv图片
+            tasks.append(NfoTask(dir_item=fileitem, owner=None, storage=fileitem.storage,
+                                 path=filepath / "tvshow.nfo",
+                                 render=lambda: self.__metadata_nfo(meta=meta, mediainfo=mediainfo),
+                                 failure=f"无法生成电视剧nfo文件：{meta.name}"))
+            # 生成目录图片，不下载季图片
+            image_dict = self.__metadata_img(mediainfo=mediainfo)
+            if image_dict is None:
+                state.failures.append(filepath)
+            for image_name, image_url in (image_dict or {}).items():
+                if image_name.startswith("season"):
+                    continue
+                tasks.append(ImageTask(dir_item=fileitem, owner=None, storage=fileitem.storage,
+                                       path=filepath / image_name, url=image_url))
+        return tasks
 
     @staticmethod
-    def __get_tmdbid_from_nfo(file_path: Path):
+    def __is_bluray_folder(state: ScrapeState, fileitem: schemas.FileItem) -> bool:
+        """
+        判断是否为原盘目录
+        """
+        if not fileitem or fileitem.type != "dir":
+            return False
+        # 蓝光原盘目录必备的文件或文件夹
+        required_files = ['BDMV', 'CERTIFICATE']
+        # 检查目录下是否存在所需文件或文件夹
+        names = state.listing.names(fileitem)
+        return any(name in names for name in required_files)
+
+    def __task_dir(self, dir_item: Optional[schemas.FileItem],
+                   owner: Optional[schemas.FileItem]) -> Optional[schemas.FileItem]:
+        """
+        任务保存文件的目录，未知时取owner的上级目录
+        """
+        if dir_item or not owner:
+            return dir_item
+        return self.storagechain.get_parent_item(owner)
+
+    def __run_nfo_task(self, state: ScrapeState, task: NfoTask):
+        """
+        生成并保存nfo，超过pre_day天或已存在时跳过，不影响同一目录的图片任务
+        """
+        if self.__check_time_out(task.path, self._pre_day):
+            logger.info(f"超过{self._pre_day}天跳过：{task.path}")
+            return
+        if not state.overwrite and state.listing.exists(task.storage, task.path):
+            logger.info(f"已存在nfo文件：{task.path}")
+            return
+        content = task.render()
+        if not content:
+            logger.warn(task.failure)
+            state.failures.append(task.path)
+            return
+        if not self.__save_file(state, self.__task_dir(task.dir_item, task.owner), task.path, content):
+            state.failures.append(task.path)
+
+    def __run_image_task(self, state: ScrapeState, task: ImageTask):
+        """
+        图片不存在时下载并保存
+        """
+        if state.listing.exists(task.storage, task.path):
+            logger.info(f"已存在图片文件：{task.path}")
+            return
+        self.__save_image(state, self.__task_dir(task.dir_item, task.owner), task.path, task.url)
+
+    def __save_file(self, state: ScrapeState, dir_item: Optional[schemas.FileItem], path: Path,
+                    content: Union[bytes, str]) -> bool:
+        """
+        保存或上传文件
+        :param dir_item: 保存的目录项
+        :param path: 元数据文件路径
+        :param content: 文件内容
+        :return: 是否保存成功
+        """
+        if not dir_item or not content or not path:
+            return False
+        state.listing.add(dir_item.storage, Path(dir_item.path) / path.name)
+        # 覆盖模式下nfo内容未变化时不重写，避免触发媒体服务器重新扫描
+        return state.writer.save(fileitem=dir_item, name=path.name, content=content,
+                          compare=state.overwrite and path.suffix == ".nfo")
+
+    def __save_image(self, state: ScrapeState, dir_item: Optional[schemas.FileItem], path: Path, url: str):
+        """
+        下载图片并保存，刮削任务运行中时交由后台下载流水线处理
+        :param dir_item: 图片保存的目录项
+        :param path: 图片文件路径
+        :param url: 图片地址
+        """
+        if not dir_item:
+            state.failures.append(path)
+            return
+        # 提前记录到快照中，避免后台下载完成前重复提交
+        state.listing.add(dir_item.storage, Path(dir_item.path) / path.name)
+        downloader = self._downloader
+        # 本地存储且缓存命中时直接硬链接或复制到目标位置
+        if downloader and downloader.cache and dir_item.storage == "local":
+            blob = downloader.cache.get(url)
+            if blob and self.__link_file(blob, Path(dir_item.path) / path.name):
+                logger.info(f"已从缓存保存图片：{path}")
+                if self._metrics:
+                    self._metrics.incr("image_cache_hit")
+                return
+        if downloader:
+            retry_queue = self._retry_queue
+
+            def __on_success(_content: bytes):
+                if not self.__save_file(state, dir_item, path, _content):
+                    state.failures.append(path)
+
+            def __on_failure():
+                # 加入重试队列的图片由下次运行补齐，不影响目录的完成状态
+                if retry_queue:
+                    retry_queue.push(RetryItem(url=url, storage=dir_item.storage,
+                                               dir_path=dir_item.path, name=path.name))
+                else:
+                    state.failures.append(path)
+
+            downloader.submit(url, callback=__on_success, on_failure=__on_failure)
+            return
+        downloader = ImageDownloader(max_inflight=1, event=self._event)
+        try:
+            content, retryable = downloader.fetch(url)
+        finally:
+            downloader.close()
+        if content:
+            if not self.__save_file(state, dir_item, path, content):
+                state.failures.append(path)
+        elif retryable:
+            state.failures.append(path)
+
+    def __recognize(self, key: str, loader: Callable[[], Optional[MediaInfo]]) -> Optional[MediaInfo]:
+        """
+        识别媒体信息，刮削任务运行中时优先使用识别缓存
+        :param key: 缓存键
+        :param loader: 实际的识别方法
+        """
+        metrics = self._metrics
+
+        def __load() -> Optional[MediaInfo]:
+            if metrics:
+                metrics.incr("recognize_miss")
+            with timer(metrics, "recognize"):
+                # 识别请求同样受上游限速和熔断控制
+                return self.__tmdb(loader)
+
+        recognize_cache = self._recognize_cache
+        if not recognize_cache:
+            return __load()
+        loaded = []
+        mediainfo = recognize_cache.get_or_load(key, lambda: loaded.append(True) or __load())
+        if metrics and not loaded:
+            metrics.incr("recognize_hit")
+        return mediainfo
+
+    def __recognize_episode(self, mediainfo: MediaInfo, file_meta: MetaBase) -> Optional[MediaInfo]:
+        """
+        识别单集所在季的媒体信息，同一季的剧集识别结果相同，按季缓存
+        """
+        return self.__recognize(
+            key=RecognizeCache.key(mediainfo.tmdb_id, MediaType.TV,
+                                   file_meta.begin_season, mediainfo.episode_group),
+            loader=lambda: self.__mediachain().recognize_media(meta=file_meta, tmdbid=mediainfo.tmdb_id,
+                                                        episode_group=mediainfo.episode_group))
+
+    def __mediachain(self) -> MediaChain:
+        """
+        刮削任务运行中复用当前线程的MediaChain
+        """
+        run_context = self._run_context
+        return run_context.mediachain if run_context else MediaChain()
+
+    def __metadata_nfo(self, **kwargs) -> Optional[str]:
+        """
+        生成nfo文件内容并统计耗时
+        """
+        with timer(self._metrics, "nfo"):
+            return self.__tmdb(lambda: self.__mediachain().metadata_nfo(**kwargs))
+
+    def __metadata_img(self, **kwargs) -> Optional[dict]:
+        """
+        获取图片地址
+        """
+        return self.__tmdb(lambda: self.__mediachain().metadata_img(**kwargs))
+
+    def __tmdb(self, func: Callable[[], T]) -> Optional[T]:
+        """
+        请求TMDB，刮削任务运行中时按域名限速和熔断
+        处理链在未识别、TMDB没有数据时同样返回None，只有抛出异常才计为请求失败
+        :param func: 实际的请求方法
+        :raises HostBlocked: 熔断中或退出事件被设置，未发出请求
+        """
+        host_guard = self._host_guard
+        if not host_guard:
+            return func()
+        host = settings.TMDB_API_DOMAIN
+        if not host_guard.acquire(host, self._event):
+            raise HostBlocked(host)
+        try:
+            result = func()
+        except Exception:
+            host_guard.failure(host)
+            raise
+        host_guard.success(host)
+        return result
+
+    def __episode_images(self, mediainfo: MediaInfo, season: Optional[int], episode: int) -> Optional[dict]:
+        """
+        获取单集图片，刮削任务运行中时从按季预取的剧集详情中获取，避免每集请求一次TMDB
+        """
+        season_prefetch = self._season_prefetch
+        if season_prefetch and mediainfo.tmdb_id and season is not None:
+            still_url = season_prefetch.still_url(tmdbid=mediainfo.tmdb_id, season=season, episode=episode,
+                                                  episode_group=mediainfo.episode_group)
+            if still_url is not None:
+                # 该季详情已获取，以其为准，没有缩略图时不再单独请求
+                return {str(episode): still_url} if still_url else {}
+        return self.__metadata_img(mediainfo=mediainfo, season=season, episode=episode)
+
+    def __read_nfo(self, file_path: Path) -> Optional[NfoInfo]:
+        """
+        读取nfo文件信息，刮削任务运行中时优先使用nfo缓存
+        """
+        if not file_path:
+            return None
+        nfo_cache = self._nfo_cache
+        if nfo_cache:
+            return nfo_cache.get(file_path)
+        if not file_path.exists():
+            return None
+        return NfoCache.parse(file_path)
+
+    def __get_tmdbid_from_nfo(self, file_path: Path):
         """
         从nfo文件中获取信息
         :param file_path:
         :return: tmdbid
         """
-        if not file_path:
+        nfo_info = self.__read_nfo(file_path)
+        return nfo_info.tmdbid if nfo_info else None
+
+    @staticmethod
+    def __link_file(src: Path, dest: Path) -> bool:
+        """
+        硬链接文件到目标位置，跨文件系统时复制
+        """
+        code, message = SystemUtils.link(src, dest)
+        if code == 0:
+            return True
+        code, message = SystemUtils.copy(src, dest)
+        if code != 0:
+            logger.warn(f"{dest} 从缓存复制图片失败：{message}")
+            return False
+        return True
+
+    @staticmethod
+    def __is_recent(mtime: float, pre_day: int) -> bool:
+        """
+        判断修改时间是否在近几天内
+        :param mtime: 修改时间戳
+        :param pre_day: 天数
+        """
+        if not mtime:
+            return False
+        return datetime.fromtimestamp(mtime) >= datetime.now() - timedelta(days=int(pre_day))
+
+    def __is_recent_dir(self, media_dir: MediaDir) -> bool:
+        """
+        判断媒体目录近pre_day天内是否有变化，不读取nfo文件
+        硬链接整理的媒体文件保留原修改时间，因此同时检查目录修改时间和已缓存的nfo添加时间
+        """
+        paths = [media_dir.path, *{file.parent for file in media_dir.files}, *media_dir.files]
+        for path in paths:
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                continue
+            if self.__is_recent(mtime, self._pre_day):
+                return True
+        dateadded = self.__latest_dateadded(media_dir.path)
+        if not dateadded:
+            return False
+        return self.__is_recent(dateadded, self._pre_day)
+
+    def __latest_dateadded(self, dir_path: Path) -> Optional[float]:
+        """
+        目录下已缓存的nfo中最晚的添加时间戳，刮削任务运行中时才有nfo缓存
+        """
+        nfo_cache = self._nfo_cache
+        dateadded = nfo_cache.latest_dateadded(dir_path) if nfo_cache else None
+        if not dateadded:
             return None
-        xpaths = [
-            "uniqueid[@type='Tmdb']",
-            "uniqueid[@type='tmdb']",
-            "uniqueid[@type='TMDB']",
-            "tmdbid"
-        ]
         try:
-            reader = NfoReader(file_path)
-            for xpath in xpaths:
-                tmdbid = reader.get_element_value(xpath)
-                if tmdbid:
-                    return tmdbid
-        except Exception as err:
-            logger.warn(f"从nfo文件中获取tmdbid失败：{str(err)}")
-        return None
+            return datetime.strptime(dateadded, "%Y-%m-%d %H:%M:%S").timestamp()
+        except ValueError:
+            return None
 
-    @staticmethod
-    def __check_time_out(file_path: Path, pre_day: int):
+    def __check_time_out(self, file_path: Path, pre_day: int):
         """
         从nfo文件中获取信息
         :param file_path:
         :return: dateadded
         """
-        if not file_path:
+        nfo_info = self.__read_nfo(file_path)
+        if not nfo_info or not nfo_info.dateadded:
             return None
-        xpaths = [
-            "dateadded"
-        ]
         try:
-            reader = NfoReader(file_path)
-            for xpath in xpaths:
-                dateadded = reader.get_element_value(xpath)
-                if dateadded:
-                    target_time = datetime.strptime(dateadded, "%Y-%m-%d %H:%M:%S")
-                    now = datetime.now()
-                    seven_days_ago = now - timedelta(days=pre_day)
-                    # 超过7天前，返回True，否则返回False
-                    return target_time < seven_days_ago
-        except Exception as err:
+            target_time = datetime.strptime(nfo_info.dateadded, "%Y-%m-%d %H:%M:%S")
+        except ValueError as err:
             logger.warn(f"从nfo文件中获取dateadded失败：{str(err)}")
-        return None
+            return None
+        # 超过pre_day天前，返回True，否则返回False
+        return target_time < datetime.now() - timedelta(days=int(pre_day))
 
     def stop_service(self):
         """
         退出插件
         """
         try:
+            if self._watcher:
+                # 目录监控触发的刮削运行在监控线程中，设置退出事件使其尽快停止
+                self._event.set()
+                self._watcher.stop()
+                self._watcher = None
+                # 等待正在进行的刮削释放运行锁后再清除退出事件
+                if self._run_lock.acquire(timeout=60):
+                    self._run_lock.release()
+                else:
+                    logger.warn("等待刮削任务停止超时")
+                self._event.clear()
             if self._scheduler:
                 self._scheduler.remove_all_jobs()
                 if self._scheduler.running:
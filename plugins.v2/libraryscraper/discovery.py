@@ -0,0 +1,200 @@
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Event
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metainfo import MetaInfoPath
+from app.log import logger
+from app.schemas import MediaType
+
+
+@dataclass
+class MediaDir:
+    """
+    发现的媒体目录
+    """
+    path: Path
+    mtype: Optional[MediaType]
+    files: List[Path] = field(default_factory=list)
+    # 匹配该目录的优先刮削路径，刮削时不按时间和增量索引跳过
+    requested: List[Path] = field(default_factory=list)
+
+
+class PathTrie:
+    """
+    路径前缀树，判断路径是否位于任一前缀目录下，耗时只与路径层数有关
+    """
+    # 前缀结束标记
+    _END = None
+
+    def __init__(self, paths: Iterable[str]):
+        self._root: Dict = {}
+        for path in paths:
+            path = path.strip() if path else ""
+            if not path:
+                continue
+            node = self._root
+            for part in Path(path).parts:
+                node = node.setdefault(part, {})
+            node[self._END] = True
+
+    def __bool__(self):
+        return bool(self._root)
+
+    def match(self, path: Path) -> bool:
+        """
+        判断路径是否等于或位于任一前缀目录下
+        """
+        node = self._root
+        if not node:
+            return False
+        for part in path.parts:
+            if self._END in node:
+                return True
+            node = node.get(part)
+            if node is None:
+                return False
+        return self._END in node
+
+
+class LibraryDiscovery:
+    """
+    媒体库目录发现：边遍历边产出媒体目录，刮削不必等待整个目录树遍历完成
+    """
+
+    def __init__(self, exclude_paths: List[str], event: Event):
+        """
+        :param exclude_paths: 排除目录
+        :param event: 退出事件
+        """
+        self._excludes = PathTrie(exclude_paths)
+        self._event = event
+
+    @staticmethod
+    def parse_paths(text: str) -> List[Tuple[Path, Optional[MediaType]]]:
+        """
+        解析刮削路径配置，路径后拼接#电视剧/电影时强制指定媒体类型
+        """
+        roots = []
+        for path in text.split("\n"):
+            if not path:
+                continue
+            # 强制指定该路径媒体类型
+            mtype = None
+            if str(path).count("#") == 1:
+                mtype = next(
+                    (mediaType for mediaType in MediaType.__members__.values() if
+                     mediaType.value == str(str(path).split("#")[1])),
+                    None)
+                path = str(path).split("#")[0]
+            roots.append((Path(path), mtype))
+        return roots
+
+    def walk(self, root: Path) -> Iterator[Path]:
+        """
+        深度优先遍历目录下的媒体文件，同一子目录下的文件连续产出
+        排除目录在遍历前剪枝，不再进入其子目录
+        """
+        if self._excludes.match(root):
+            logger.debug(f"{root} 在排除目录中，跳过 ...")
+            return
+        for dirpath, dirnames, filenames in os.walk(root):
+            current = Path(dirpath)
+            kept = []
+            for dirname in sorted(dirnames):
+                if self._excludes and self._excludes.match(current / dirname):
+                    logger.debug(f"{current / dirname} 在排除目录中，跳过 ...")
+                    continue
+                kept.append(dirname)
+            dirnames[:] = kept
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1].lower() not in settings.RMT_MEDIAEXT:
+                    continue
+                file_path = current / filename
+                # 排除路径也可以是单个文件
+                if self._excludes and self._excludes.match(file_path):
+                    continue
+                yield file_path
+
+    def discover(self, roots: List[Tuple[Path, Optional[MediaType]]]) -> Iterator[MediaDir]:
+        """
+        遍历刮削路径，每个媒体目录下的文件收集完成后立即产出
+        """
+        # 已产出的目录
+        seen = set()
+        # 重命名格式中的文件夹层数，每次运行只计算一次
+        levels = {
+            MediaType.TV: self.rename_format_level(MediaType.TV),
+            MediaType.MOVIE: self.rename_format_level(MediaType.MOVIE),
+        }
+        for scraper_path, root_mtype in roots:
+            # 判断路径是否存在
+            if not scraper_path.exists():
+                logger.warning(f"媒体库刮削路径不存在：{scraper_path}")
+                continue
+            logger.info(f"开始检索目录：{scraper_path} {root_mtype} ...")
+            # 文件所在目录 -> 识别出的媒体类型，同一目录只识别第一个文件
+            type_cache: Dict[Path, MediaType] = {}
+            # 尚未离开其子树的媒体目录，按发现顺序排列
+            # 同一媒体目录的文件可能被其下的其他媒体目录（如季目录下的花絮目录）隔开，离开子树后才能产出
+            opened: Dict[Tuple[Path, MediaType], MediaDir] = {}
+            for file_path in self.walk(scraper_path):
+                if self._event.is_set():
+                    logger.info(f"媒体库刮削服务停止")
+                    return
+                # 深度优先遍历，离开一个目录的子树后不会再回到该子树
+                for dir_item in [key for key in opened if not file_path.is_relative_to(key[0])]:
+                    yield opened.pop(dir_item)
+                # 识别是电影还是电视剧
+                mtype = root_mtype or type_cache.get(file_path.parent)
+                if not mtype:
+                    mtype = MetaInfoPath(file_path).type
+                    type_cache[file_path.parent] = mtype
+                rename_format_level = levels[MediaType.TV] if mtype == MediaType.TV else levels[MediaType.MOVIE]
+                if rename_format_level < 1:
+                    continue
+                # 取相对路径的第1层目录
+                media_path = file_path.parents[rename_format_level - 1]
+                dir_item = (media_path, mtype)
+                if dir_item in opened:
+                    opened[dir_item].files.append(file_path)
+                    continue
+                if dir_item in seen:
+                    continue
+                seen.add(dir_item)
+                logger.info(f"发现目录：{dir_item}")
+                opened[dir_item] = MediaDir(path=media_path, mtype=mtype, files=[file_path])
+            yield from opened.values()
+
+    def locate(self, file_path: Path,
+               roots: List[Tuple[Path, Optional[MediaType]]]) -> Optional[Tuple[Path, MediaType]]:
+        """
+        查找单个媒体文件所属的媒体目录，用于目录监控等增量场景
+        """
+        if self._excludes.match(file_path):
+            return None
+        # 取层级最深的刮削路径
+        matched = [(root, mtype) for root, mtype in roots if file_path.is_relative_to(root)]
+        if not matched:
+            return None
+        root, mtype = max(matched, key=lambda item: len(item[0].parts))
+        if not mtype:
+            mtype = MetaInfoPath(file_path).type
+        rename_format_level = self.rename_format_level(mtype)
+        if rename_format_level < 1 or len(file_path.parents) < rename_format_level:
+            return None
+        media_path = file_path.parents[rename_format_level - 1]
+        if not media_path.is_relative_to(root):
+            return None
+        return media_path, mtype
+
+    @staticmethod
+    def rename_format_level(mtype: Optional[MediaType]) -> int:
+        """
+        计算重命名格式中的文件夹层数
+        """
+        rename_format = settings.TV_RENAME_FORMAT \
+            if mtype == MediaType.TV else settings.MOVIE_RENAME_FORMAT
+        return len(rename_format.split("/")) - 1
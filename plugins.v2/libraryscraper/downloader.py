@@ -0,0 +1,298 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from app.core.config import settings
+from app.log import logger
+from app.utils.http import RequestUtils
+
+from .imagecache import ImageCache
+from .limiter import HostGuard
+from .metrics import RunMetrics, timer
+from .store import SqliteStore
+
+
+@dataclass
+class RetryItem:
+    """
+    下载失败待重试的图片
+    """
+    url: str
+    storage: str
+    dir_path: str
+    name: str
+    attempts: int = 0
+
+
+class RetryQueue(SqliteStore):
+    """
+    下载失败图片的持久化重试队列，下次运行时优先重试
+    """
+    _schema = """
+    CREATE TABLE IF NOT EXISTS image_retry (
+        storage TEXT NOT NULL,
+        dir_path TEXT NOT NULL,
+        name TEXT NOT NULL,
+        url TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (storage, dir_path, name)
+    );
+    """
+    # 超过重试次数后放弃
+    max_attempts = 5
+
+    def push(self, item: RetryItem):
+        """
+        加入重试队列，已存在时累加失败次数，超过重试次数后移出队列
+        """
+        rows = self.execute("SELECT attempts FROM image_retry WHERE storage = ? AND dir_path = ? AND name = ?",
+                            (item.storage, item.dir_path, item.name))
+        attempts = (rows[0][0] if rows else 0) + 1
+        if attempts >= self.max_attempts:
+            logger.warn(f"{item.dir_path}/{item.name} 已重试 {attempts} 次仍下载失败，放弃下载")
+            self.remove(item)
+            return
+        self.execute("INSERT OR REPLACE INTO image_retry (storage, dir_path, name, url, attempts, updated_at) "
+                     "VALUES (?, ?, ?, ?, ?, ?)",
+                     (item.storage, item.dir_path, item.name, item.url, attempts, time.time()))
+
+    def remove(self, item: RetryItem):
+        self.execute("DELETE FROM image_retry WHERE storage = ? AND dir_path = ? AND name = ?",
+                     (item.storage, item.dir_path, item.name))
+
+    def items(self) -> List[RetryItem]:
+        rows = self.execute("SELECT url, storage, dir_path, name, attempts FROM image_retry ORDER BY updated_at")
+        return [RetryItem(*row) for row in rows]
+
+
+class DownloadGroup:
+    """
+    同一个目录提交的下载任务，全部下载完成后调用回调，不阻塞提交方
+    """
+
+    def __init__(self):
+        # 尚未完成的下载任务数
+        self._pending = 0
+        self._callback: Optional[Callable[[], None]] = None
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self._pending += 1
+
+    def done(self):
+        """
+        组内一个下载任务完成或被取消，由下载器在处理完该任务的回调后调用
+        """
+        with self._lock:
+            self._pending -= 1
+            callback = self._callback if not self._pending else None
+            if callback:
+                self._callback = None
+        if callback:
+            callback()
+
+    def then(self, callback: Callable[[], None]):
+        """
+        组内的下载任务全部完成后在下载线程中调用callback，已全部完成时立即在当前线程调用
+        """
+        with self._lock:
+            if self._pending:
+                self._callback = callback
+                return
+        callback()
+
+
+class ImageDownloader:
+    """
+    图片下载流水线：共享长连接会话，后台并发下载，失败按指数退避重试
+    """
+
+    # 不需要重试的状态码
+    _no_retry_status = {400, 401, 403, 404, 410}
+
+    def __init__(self, max_inflight: int = 4, retries: int = 3, backoff: float = 1.0,
+                 event: Optional[threading.Event] = None, cache: Optional[ImageCache] = None,
+                 guard: Optional[HostGuard] = None, metrics: Optional[RunMetrics] = None):
+        """
+        :param max_inflight: 同时下载的图片数
+        :param retries: 失败重试次数
+        :param backoff: 首次重试等待秒数，之后每次翻倍
+        :param event: 退出事件，设置后停止重试
+        :param cache: 本地图片缓存，命中时不再下载
+        :param guard: 按域名限速和熔断
+        :param metrics: 运行统计
+        """
+        self.cache = cache
+        self._guard = guard
+        self._metrics = metrics
+        self._max_inflight = max(1, max_inflight)
+        self._retries = max(0, retries)
+        self._backoff = backoff
+        self._event = event or threading.Event()
+        self._session = Session()
+        adapter = HTTPAdapter(pool_connections=self._max_inflight, pool_maxsize=self._max_inflight)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self._max_inflight,
+                                            thread_name_prefix="LibraryScraperOwn-Image")
+        # 排队中的任务数上限，队列满时阻塞提交方，避免遍历速度远超下载速度
+        self._slots = threading.BoundedSemaphore(self._max_inflight * 4)
+        self._futures: Set[Future] = set()
+        self._lock = threading.Lock()
+        # 在途任务及其回调全部完成时通知
+        self._idle = threading.Condition(self._lock)
+        # 当前线程正在收集的下载任务组
+        self._local = threading.local()
+
+    def download(self, url: str) -> Optional[bytes]:
+        """
+        同步下载图片，失败时重试
+        """
+        return self.fetch(url)[0]
+
+    def fetch(self, url: str) -> Tuple[Optional[bytes], bool]:
+        """
+        同步下载图片，失败时重试
+        :return: 图片内容，失败时是否值得稍后重试（图片不存在时无需重试）
+        """
+        if self.cache:
+            content = self.cache.read(url)
+            if content:
+                logger.debug(f"图片缓存命中：{url}")
+                self.__count("image_cache_hit")
+                return content, False
+            self.__count("image_cache_miss")
+        host = urlparse(url).netloc
+        delay = self._backoff
+        for attempt in range(self._retries + 1):
+            if attempt:
+                # 退出事件被设置时不再重试
+                if self._event.wait(delay):
+                    break
+                delay *= 2
+            if self._guard and not self._guard.acquire(host, self._event):
+                logger.info(f"{host} 暂停请求中，稍后重试：{url}")
+                break
+            try:
+                logger.info(f"正在下载图片：{url} ...")
+                with timer(self._metrics, "download"):
+                    r = RequestUtils(proxies=settings.PROXY, session=self._session).get_res(url=url)
+                self.__count("image_request")
+                if r is not None and r.ok:
+                    self.__count("bytes_downloaded", len(r.content))
+                    if self._guard:
+                        self._guard.success(host)
+                    if self.cache:
+                        self.cache.put(url, r.content)
+                    return r.content, False
+                if r is not None and r.status_code in self._no_retry_status:
+                    if self._guard:
+                        self._guard.success(host)
+                    logger.info(f"{url} 图片不存在：{r.status_code}")
+                    return None, False
+                logger.info(f"{url} 图片下载失败，请检查网络连通性！")
+            except Exception as err:
+                logger.error(f"{url} 图片下载失败：{str(err)}！")
+            if self._guard:
+                self._guard.failure(host)
+        return None, True
+
+    def __count(self, name: str, value: int = 1):
+        if self._metrics:
+            self._metrics.incr(name, value)
+
+    def submit(self, url: str, callback: Callable[[bytes], None],
+               on_failure: Optional[Callable[[], None]] = None):
+        """
+        提交后台下载任务，下载成功后在下载线程中调用callback处理图片内容
+        下载失败且值得稍后重试、因退出未下载或排队中被取消时调用on_failure
+        """
+        self._slots.acquire()
+        group = getattr(self._local, "group", None)
+        if group is not None:
+            group.add()
+        try:
+            future = self._executor.submit(self.__run, url, callback, on_failure)
+        except RuntimeError:
+            # 下载器已关闭
+            self._slots.release()
+            if group is not None:
+                group.done()
+            return
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(lambda _future: self.__done(_future, on_failure, group))
+
+    @contextmanager
+    def group(self) -> Iterator[DownloadGroup]:
+        """
+        当前线程在上下文中提交的下载任务归入同一组
+        """
+        group = DownloadGroup()
+        previous = getattr(self._local, "group", None)
+        self._local.group = group
+        try:
+            yield group
+        finally:
+            self._local.group = previous
+
+    def __run(self, url: str, callback: Callable[[bytes], None], on_failure: Optional[Callable[[], None]]):
+        if self._event.is_set():
+            # 退出时未下载的图片留待下次运行重试
+            if on_failure:
+                on_failure()
+            return
+        content, retryable = self.fetch(url)
+        if content:
+            try:
+                callback(content)
+            except Exception as err:
+                logger.error(f"{url} 图片保存失败：{str(err)}")
+        elif retryable and on_failure:
+            on_failure()
+
+    def __done(self, future: Future, on_failure: Optional[Callable[[], None]],
+               group: Optional[DownloadGroup]):
+        self._slots.release()
+        try:
+            if future.cancelled() and on_failure:
+                # 关闭时被取消的排队任务同样留待下次运行重试
+                try:
+                    on_failure()
+                except Exception as err:
+                    logger.error(f"图片加入重试队列失败：{str(err)}")
+            if group is not None:
+                try:
+                    group.done()
+                except Exception as err:
+                    logger.error(f"下载完成回调处理失败：{str(err)}")
+        finally:
+            # 回调处理完后才移出在途任务，join返回时组回调均已执行
+            with self._lock:
+                self._futures.discard(future)
+                if not self._futures:
+                    self._idle.notify_all()
+
+    def join(self):
+        """
+        等待已提交的下载任务及其完成回调全部结束
+        """
+        with self._lock:
+            while self._futures:
+                self._idle.wait()
+
+    def close(self):
+        """
+        关闭下载器，退出事件已设置时取消排队中的任务
+        """
+        self._executor.shutdown(wait=True, cancel_futures=self._event.is_set())
+        self._session.close()
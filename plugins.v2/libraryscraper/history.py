@@ -0,0 +1,107 @@
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+
+from app.db import SessionFactory
+from app.db.models.transferhistory import TransferHistory
+from app.db.transferhistory_oper import TransferHistoryOper
+from app.log import logger
+
+from .metrics import RunMetrics
+
+
+class TransferTitles:
+    """
+    整理记录中的媒体标题，按tmdbid分批预加载，刮削目录时从内存中查询
+    已提交刮削的目录先登记上次识别到的tmdbid，首次未命中时与其它待加载的tmdbid合并为一次查询
+    """
+    # 每次查询的tmdbid数，避免超出SQLite的参数个数上限
+    chunk_size = 500
+
+    def __init__(self, metrics: Optional[RunMetrics] = None):
+        self._metrics = metrics
+        # (tmdbid, 媒体类型) -> 标题
+        self._titles: Dict[Tuple[int, str], str] = {}
+        # 已查询过的tmdbid，包括没有整理记录的
+        self._loaded: Set[int] = set()
+        # 单独查询过的(tmdbid, 媒体类型)
+        self._queried: Set[Tuple[int, str]] = set()
+        # 已提交刮削、尚未加载的目录 -> tmdbid
+        self._pending: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __count(self, name: str):
+        if self._metrics:
+            self._metrics.incr(name)
+
+    def preload(self, tmdbids: Iterable[int]):
+        """
+        分批查询tmdbid对应的整理记录标题，每个tmdbid和媒体类型取最早的一条记录
+        """
+        tmdbids = sorted({int(tmdbid) for tmdbid in tmdbids if tmdbid})
+        if not tmdbids:
+            return
+        titles: Dict[Tuple[int, str], str] = {}
+        loaded: List[int] = []
+        try:
+            with SessionFactory() as db:
+                for i in range(0, len(tmdbids), self.chunk_size):
+                    chunk = tmdbids[i:i + self.chunk_size]
+                    first_ids = db.query(func.min(TransferHistory.id)) \
+                        .filter(TransferHistory.tmdbid.in_(chunk)) \
+                        .group_by(TransferHistory.tmdbid, TransferHistory.type)
+                    rows = db.query(TransferHistory.tmdbid, TransferHistory.type, TransferHistory.title) \
+                        .filter(TransferHistory.id.in_(first_ids)).all()
+                    self.__count("transfer_history_query")
+                    for tmdbid, mtype, title in rows:
+                        if title:
+                            titles[(tmdbid, mtype)] = title
+                    loaded.extend(chunk)
+        except Exception as err:
+            logger.warn(f"批量查询整理记录失败，改为逐个查询：{str(err)}")
+        with self._lock:
+            self._titles.update(titles)
+            self._loaded.update(loaded)
+        if loaded:
+            logger.info(f"已预加载 {len(loaded)} 个tmdbid的整理记录，其中 {len(titles)} 条有标题")
+
+    def want(self, path: Path, tmdbid: int):
+        """
+        登记即将刮削的目录上次识别到的tmdbid
+        """
+        with self._lock:
+            if tmdbid and int(tmdbid) not in self._loaded:
+                self._pending[str(path)] = int(tmdbid)
+
+    def drop(self, path: Path):
+        """
+        目录跳过刮削时不再加载其tmdbid
+        """
+        with self._lock:
+            self._pending.pop(str(path), None)
+
+    def get(self, tmdbid: int, mtype: str) -> Optional[str]:
+        """
+        查询tmdbid之前整理时的标题，有待加载的tmdbid时一起批量查询，否则单独查询一次
+        """
+        key = (tmdbid, mtype)
+        with self._lock:
+            if tmdbid in self._loaded or key in self._queried:
+                self.__count("transfer_history_hit")
+                return self._titles.get(key)
+            pending = set(self._pending.values())
+            self._pending.clear()
+        if pending:
+            self.preload(pending | {tmdbid})
+            with self._lock:
+                if tmdbid in self._loaded:
+                    return self._titles.get(key)
+        transfer_history = TransferHistoryOper().get_by_type_tmdbid(tmdbid=tmdbid, mtype=mtype)
+        self.__count("transfer_history_query")
+        with self._lock:
+            self._queried.add(key)
+            if transfer_history and transfer_history.title:
+                self._titles[key] = transfer_history.title
+            return self._titles.get(key)
@@ -0,0 +1,130 @@
+import hashlib
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from app.log import logger
+from app.utils.string import StringUtils
+
+from .store import SqliteStore
+
+
+class ImageCache(SqliteStore):
+    """
+    按内容寻址的本地图片缓存：图片地址 -> 内容哈希 -> 磁盘文件
+    相同内容只保存一份，超过容量时按最近最少使用淘汰，超过有效期的缓存视为未命中
+    """
+    _schema = """
+    CREATE TABLE IF NOT EXISTS image_cache (
+        url TEXT PRIMARY KEY,
+        sha256 TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        fetched_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_image_cache_sha256 ON image_cache (sha256);
+    CREATE INDEX IF NOT EXISTS idx_image_cache_accessed ON image_cache (accessed_at);
+    """
+
+    def __init__(self, cache_dir: Path, max_size: int, ttl: int):
+        """
+        :param cache_dir: 缓存目录
+        :param max_size: 缓存容量上限，单位字节
+        :param ttl: 缓存有效期，单位秒
+        """
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self._blob_dir = cache_dir / "blobs"
+        self._max_size = max_size
+        self._ttl = ttl
+        # 写入和淘汰缓存文件时互斥
+        self._evict_lock = threading.Lock()
+        super().__init__(cache_dir / "images.db")
+        self._total_size = self.__disk_size()
+
+    def __disk_size(self) -> int:
+        rows = self.execute("SELECT COALESCE(SUM(size), 0) FROM "
+                            "(SELECT sha256, MAX(size) AS size FROM image_cache GROUP BY sha256)")
+        return rows[0][0] if rows else 0
+
+    def __blob_path(self, sha256: str) -> Path:
+        return self._blob_dir / sha256[:2] / sha256
+
+    def get(self, url: str) -> Optional[Path]:
+        """
+        查询图片缓存，命中时返回缓存文件路径
+        """
+        rows = self.execute("SELECT sha256, fetched_at FROM image_cache WHERE url = ?", (url,))
+        if not rows:
+            return None
+        sha256, fetched_at = rows[0]
+        blob = self.__blob_path(sha256)
+        if time.time() - fetched_at > self._ttl or not blob.exists():
+            return None
+        self.execute("UPDATE image_cache SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        return blob
+
+    def read(self, url: str) -> Optional[bytes]:
+        """
+        读取缓存的图片内容
+        """
+        blob = self.get(url)
+        if not blob:
+            return None
+        try:
+            return blob.read_bytes()
+        except OSError:
+            return None
+
+    def put(self, url: str, content: bytes) -> Optional[Path]:
+        """
+        写入图片缓存，返回缓存文件路径
+        """
+        if not content:
+            return None
+        sha256 = hashlib.sha256(content).hexdigest()
+        blob = self.__blob_path(sha256)
+        tmp_blob = None
+        try:
+            if not blob.exists():
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                # 先写临时文件再重命名，避免并发读到不完整的内容
+                tmp_blob = blob.with_name(f"{sha256}.{StringUtils.generate_random_str(6)}")
+                tmp_blob.write_bytes(content)
+            # 多个下载线程可能同时写入相同内容，检查、重命名和容量统计与淘汰互斥，同一内容只计入一次
+            with self._evict_lock:
+                if tmp_blob and not blob.exists():
+                    tmp_blob.replace(blob)
+                    self._total_size += len(content)
+                now = time.time()
+                self.execute("INSERT OR REPLACE INTO image_cache (url, sha256, size, fetched_at, accessed_at) "
+                             "VALUES (?, ?, ?, ?, ?)", (url, sha256, len(content), now, now))
+        except OSError as err:
+            logger.warn(f"写入图片缓存失败：{str(err)}")
+            return None
+        finally:
+            if tmp_blob and tmp_blob.exists():
+                tmp_blob.unlink(missing_ok=True)
+        if self._total_size > self._max_size:
+            self.evict()
+        return blob
+
+    def evict(self):
+        """
+        淘汰最近最少使用的缓存，直到容量降到上限的90%以下
+        """
+        with self._evict_lock:
+            target = self._max_size * 0.9
+            while self._total_size > target:
+                rows = self.execute("SELECT url, sha256 FROM image_cache ORDER BY accessed_at LIMIT 100")
+                if not rows:
+                    self._total_size = 0
+                    break
+                self.executemany("DELETE FROM image_cache WHERE url = ?", [(row[0],) for row in rows])
+                for sha256 in {row[1] for row in rows}:
+                    # 其它地址仍引用相同内容时保留文件
+                    if self.execute("SELECT 1 FROM image_cache WHERE sha256 = ? LIMIT 1", (sha256,)):
+                        continue
+                    self.__blob_path(sha256).unlink(missing_ok=True)
+                self._total_size = self.__disk_size()
+            logger.info(f"图片缓存清理完成，当前占用：{StringUtils.str_filesize(self._total_size)}")
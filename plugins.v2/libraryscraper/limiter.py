@@ -0,0 +1,125 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from app.log import logger
+
+
+class HostBlocked(Exception):
+    """
+    域名熔断中或退出事件已设置，请求未发出
+    """
+
+
+class TokenBucket:
+    """
+    令牌桶限速，平均每秒rate次，允许burst次突发
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self._rate = rate
+        self._capacity = max(1, burst)
+        self._tokens = float(self._capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, event: Optional[threading.Event] = None) -> bool:
+        """
+        获取一个令牌，令牌不足时等待，退出事件被设置时返回False
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                delay = (1 - self._tokens) / self._rate
+            if event and event.wait(delay):
+                return False
+            if not event:
+                time.sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败达到阈值后暂停请求一段时间，冷却结束后放行一次试探请求
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: int = 60):
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._failures < self._threshold:
+                return True
+            if time.monotonic() - self._opened_at >= self._cooldown:
+                # 半开状态，放行一次试探请求，失败后重新计时
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+
+    def failure(self) -> bool:
+        """
+        记录一次失败，返回是否触发熔断
+        """
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self._threshold:
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+
+class HostGuard:
+    """
+    按域名限速和熔断，避免触发上游限流或在上游故障时持续请求
+    """
+
+    def __init__(self, rate: float, burst: int = 5, threshold: int = 5, cooldown: int = 60):
+        """
+        :param rate: 每个域名每秒请求数，0为不限速
+        :param burst: 允许的突发请求数
+        :param threshold: 连续失败多少次后熔断
+        :param cooldown: 熔断持续秒数
+        """
+        self._rate = rate
+        self._burst = burst
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def __get(self, host: str) -> Tuple[Optional[TokenBucket], CircuitBreaker]:
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(threshold=self._threshold, cooldown=self._cooldown)
+                if self._rate > 0:
+                    self._buckets[host] = TokenBucket(rate=self._rate, burst=self._burst)
+            return self._buckets.get(host), self._breakers[host]
+
+    def acquire(self, host: str, event: Optional[threading.Event] = None) -> bool:
+        """
+        请求前调用，域名熔断中或退出事件被设置时返回False
+        """
+        bucket, breaker = self.__get(host)
+        if not breaker.allow():
+            return False
+        return bucket.acquire(event) if bucket else True
+
+    def success(self, host: str):
+        self.__get(host)[1].success()
+
+    def failure(self, host: str):
+        if self.__get(host)[1].failure():
+            logger.warn(f"{host} 连续请求失败，暂停请求 {self._cooldown} 秒")
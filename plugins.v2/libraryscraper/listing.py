@@ -0,0 +1,104 @@
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from app import schemas
+from app.chain.storage import StorageChain
+from app.log import logger
+
+from .metrics import RunMetrics, timer
+from .writer import MetadataWriter
+
+
+class DirListing:
+    """
+    目录列表快照：每个目录只列出一次，文件是否存在都从快照中判断，减少网盘等存储的请求次数
+    """
+
+    def __init__(self, storagechain: StorageChain, metrics: Optional[RunMetrics] = None):
+        self._storagechain = storagechain
+        self._metrics = metrics
+        self._items: Dict[Tuple[str, str], List[schemas.FileItem]] = {}
+        self._names: Dict[Tuple[str, str], Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def __key(storage: str, path: Path) -> Tuple[str, str]:
+        return storage, path.as_posix().rstrip("/")
+
+    def list(self, fileitem: schemas.FileItem) -> List[schemas.FileItem]:
+        """
+        列出目录下的文件，同一目录只请求一次存储
+        """
+        key = self.__key(fileitem.storage, Path(fileitem.path))
+        with self._lock:
+            if key in self._items:
+                return self._items[key]
+        with timer(self._metrics, "listing"):
+            items = self._storagechain.list_files(fileitem=fileitem) or []
+        if self._metrics:
+            self._metrics.incr(f"storage_list_{fileitem.storage}")
+        if fileitem.storage == "local":
+            items = self.__sweep(items)
+        with self._lock:
+            self._items[key] = items
+            self._names.setdefault(key, set()).update(item.name for item in items)
+        return items
+
+    @staticmethod
+    def __sweep(items: List[schemas.FileItem]) -> List[schemas.FileItem]:
+        """
+        清理本地写入中途崩溃残留的临时文件
+        """
+        kept = []
+        for item in items:
+            if item.type == "file" and MetadataWriter.is_stale_temp(item.name, item.modify_time):
+                try:
+                    Path(item.path).unlink()
+                    logger.info(f"已清理残留的临时文件：{item.path}")
+                    continue
+                except OSError as err:
+                    logger.debug(f"清理临时文件失败：{item.path} {str(err)}")
+            kept.append(item)
+        return kept
+
+    def names(self, fileitem: schemas.FileItem) -> Set[str]:
+        """
+        目录下的文件名集合
+        """
+        self.list(fileitem)
+        with self._lock:
+            return self._names.get(self.__key(fileitem.storage, Path(fileitem.path)), set())
+
+    def exists(self, storage: str, path: Path) -> bool:
+        """
+        判断文件是否存在，上级目录未列出时先列出上级目录
+        """
+        key = self.__key(storage, path.parent)
+        with self._lock:
+            names = self._names.get(key)
+            if names is not None and key in self._items:
+                return path.name in names
+        parent_item = self._storagechain.get_file_item(storage=storage, path=path.parent)
+        if self._metrics:
+            self._metrics.incr(f"storage_get_{storage}")
+        if not parent_item:
+            return False
+        return path.name in self.names(parent_item)
+
+    def add(self, storage: str, path: Path):
+        """
+        记录新写入的文件
+        """
+        key = self.__key(storage, path.parent)
+        with self._lock:
+            self._names.setdefault(key, set()).add(path.name)
+
+    def release(self, fileitem: schemas.FileItem):
+        """
+        目录处理完成后释放其列表，之后再判断该目录下的文件时重新列出
+        """
+        key = self.__key(fileitem.storage, Path(fileitem.path))
+        with self._lock:
+            self._items.pop(key, None)
+            self._names.pop(key, None)
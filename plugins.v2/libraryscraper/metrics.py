@@ -0,0 +1,153 @@
+import heapq
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _Samples:
+    """
+    耗时样本，超过上限后按蓄水池抽样保留，用于估算分位数
+    """
+
+    def __init__(self, limit: int = 5000):
+        self._limit = limit
+        self.count = 0
+        self.total = 0.0
+        self.values: List[float] = []
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if len(self.values) < self._limit:
+            self.values.append(value)
+        else:
+            index = random.randrange(self.count)
+            if index < self._limit:
+                self.values[index] = value
+
+    def percentile(self, percent: float) -> float:
+        if not self.values:
+            return 0.0
+        values = sorted(self.values)
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class RunMetrics:
+    """
+    单次刮削运行的性能统计：各阶段耗时、计数、下载字节数和最慢的目录
+    """
+    # 统计的阶段及名称
+    stages = {
+        "walk": "目录遍历",
+        "listing": "目录列表",
+        "recognize": "媒体识别",
+        "obtain_images": "获取图片地址",
+        "download": "图片下载",
+        "nfo": "生成nfo",
+        "save": "保存文件",
+        "directory": "目录刮削",
+        "chain_init": "创建处理链",
+    }
+
+    def __init__(self, slowest: int = 10):
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self._samples: Dict[str, _Samples] = {}
+        self._counters: Dict[str, int] = {}
+        self._slowest: List[Tuple[float, str]] = []
+        self._slowest_limit = slowest
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(stage, _Samples()).add(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        统计代码块耗时
+        """
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - begin)
+
+    def timed_iter(self, stage: str, items: Iterable[T]) -> Iterator[T]:
+        """
+        统计生成器每次产出的耗时，用于统计边遍历边产出的目录发现
+        """
+        iterator = iter(items)
+        while True:
+            begin = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.record(stage, time.perf_counter() - begin)
+                return
+            self.record(stage, time.perf_counter() - begin)
+            yield item
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def directory(self, path: str, seconds: float):
+        """
+        记录一个目录的刮削耗时
+        """
+        self.record("directory", seconds)
+        with self._lock:
+            if len(self._slowest) < self._slowest_limit:
+                heapq.heappush(self._slowest, (seconds, path))
+            else:
+                heapq.heappushpop(self._slowest, (seconds, path))
+
+    def __ratio(self, hit: str, miss: str) -> Optional[float]:
+        total = self._counters.get(hit, 0) + self._counters.get(miss, 0)
+        return round(self._counters.get(hit, 0) / total, 4) if total else None
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        汇总统计结果
+        """
+        finished = self.finished or time.time()
+        duration = max(finished - self.started, 0.001)
+        with self._lock:
+            directories = self._counters.get("directories", 0)
+            return {
+                "started": self.started,
+                "finished": finished,
+                "duration": round(duration, 2),
+                "directories": directories,
+                "throughput": round(directories / duration * 60, 2),
+                "bytes_downloaded": self._counters.get("bytes_downloaded", 0),
+                "counters": dict(self._counters),
+                "cache": {
+                    "recognize": self.__ratio("recognize_hit", "recognize_miss"),
+                    "image": self.__ratio("image_cache_hit", "image_cache_miss"),
+                    "nfo": self.__ratio("nfo_cache_hit", "nfo_cache_miss"),
+                },
+                "stages": {
+                    stage: {
+                        "name": self.stages.get(stage, stage),
+                        "count": samples.count,
+                        "total": round(samples.total, 3),
+                        "p50": round(samples.percentile(50), 3),
+                        "p95": round(samples.percentile(95), 3),
+                    } for stage, samples in self._samples.items()
+                },
+                "slowest": [{"path": path, "seconds": round(seconds, 2)}
+                            for seconds, path in sorted(self._slowest, reverse=True)],
+            }
+
+
+def timer(metrics: Optional[RunMetrics], stage: str):
+    """
+    统计对象为空时不统计
+    """
+    return metrics.timer(stage) if metrics else nullcontext()
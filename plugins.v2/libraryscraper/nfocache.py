@@ -0,0 +1,108 @@
+import json
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from app.helper.nfo import NfoReader
+from app.log import logger
+
+from .metrics import RunMetrics
+from .store import SqliteStore
+
+
+@dataclass
+class NfoInfo:
+    """
+    从nfo文件中一次解析出的信息
+    """
+    tmdbid: Optional[str] = None
+    dateadded: Optional[str] = None
+    uniqueids: Dict[str, str] = field(default_factory=dict)
+
+
+class NfoCache(SqliteStore):
+    """
+    已解析nfo的缓存，按路径+修改时间+大小判断文件是否变化，未变化的nfo不再重复解析
+    """
+    _schema = """
+    CREATE TABLE IF NOT EXISTS nfo_cache (
+        path TEXT PRIMARY KEY,
+        mtime REAL NOT NULL,
+        size INTEGER NOT NULL,
+        tmdbid TEXT,
+        dateadded TEXT,
+        uniqueids TEXT
+    );
+    """
+
+    def __init__(self, db_path: Path, metrics: Optional[RunMetrics] = None):
+        super().__init__(db_path)
+        self._metrics = metrics
+        self._memory: Dict[str, Tuple[float, int, NfoInfo]] = {}
+        self._memory_lock = threading.Lock()
+
+    @staticmethod
+    def parse(file_path: Path) -> Optional[NfoInfo]:
+        """
+        解析nfo文件，一次读取tmdbid、dateadded和所有uniqueid
+        """
+        try:
+            reader = NfoReader(file_path)
+        except Exception as err:
+            logger.warn(f"解析nfo文件失败：{file_path} {str(err)}")
+            return None
+        info = NfoInfo(dateadded=reader.get_element_value("dateadded"))
+        for element in reader.root.iter("uniqueid"):
+            id_type = (element.get("type") or "").lower()
+            if id_type and element.text:
+                info.uniqueids[id_type] = element.text.strip()
+        info.tmdbid = info.uniqueids.get("tmdb") or reader.get_element_value("tmdbid")
+        return info
+
+    def __count(self, name: str):
+        if self._metrics:
+            self._metrics.incr(name)
+
+    def get(self, file_path: Path) -> Optional[NfoInfo]:
+        """
+        获取nfo信息，文件不存在时返回None
+        """
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return None
+        key = str(file_path)
+        with self._memory_lock:
+            cached = self._memory.get(key)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            self.__count("nfo_cache_hit")
+            return cached[2]
+        rows = self.execute("SELECT mtime, size, tmdbid, dateadded, uniqueids FROM nfo_cache WHERE path = ?",
+                            (key,))
+        if rows and rows[0][0] == stat.st_mtime and rows[0][1] == stat.st_size:
+            info = NfoInfo(tmdbid=rows[0][2], dateadded=rows[0][3],
+                           uniqueids=json.loads(rows[0][4] or "{}"))
+            self.__count("nfo_cache_hit")
+        else:
+            self.__count("nfo_cache_miss")
+            info = self.parse(file_path)
+            if not info:
+                return None
+            self.execute("INSERT OR REPLACE INTO nfo_cache (path, mtime, size, tmdbid, dateadded, uniqueids) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (key, stat.st_mtime, stat.st_size, info.tmdbid, info.dateadded,
+                          json.dumps(info.uniqueids)))
+        with self._memory_lock:
+            self._memory[key] = (stat.st_mtime, stat.st_size, info)
+        return info
+
+    def latest_dateadded(self, dir_path: Path) -> Optional[str]:
+        """
+        目录下已缓存的nfo中最晚的添加时间，只查询缓存，不读取nfo文件
+        """
+        prefix = str(dir_path).rstrip("/")
+        # 路径主键上的范围查询，"0"是"/"的下一个字符
+        rows = self.execute("SELECT MAX(dateadded) FROM nfo_cache WHERE path > ? AND path < ?",
+                            (prefix + "/", prefix + "0"))
+        return rows[0][0] if rows else None
@@ -0,0 +1,184 @@
+import os
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set
+
+from app.core.config import settings
+from app.core.metainfo import MetaInfo
+
+from .discovery import MediaDir
+
+# 刮削时保存的图片格式
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+class ScrapePlan:
+    """
+    刮削计划：只检查元数据文件是否存在和识别缓存，估算一次刮削要生成的nfo、下载的图片和上游请求数
+    上游请求数按刮削流程估算：每个目录识别一次和获取一次图片，电视剧每季识别一次、预取一次剧集详情
+    图片只检查海报和背景图，fanart等来源的图片在获取图片地址后才能确定，图片数和下载量为下限
+    """
+
+    def __init__(self, overwrite: bool, image_size: int, timed_out: Callable[[Path], bool]):
+        """
+        :param overwrite: 是否覆盖模式，覆盖模式下已有的nfo也会重新生成
+        :param image_size: 估算下载量时每张图片的字节数
+        :param timed_out: 判断已有nfo的添加时间是否超过pre_day天，超过的nfo刮削时会跳过
+        """
+        self.started = time.time()
+        self.overwrite = overwrite
+        self.image_size = image_size
+        self._timed_out = timed_out
+        self.directories = 0
+        self.media_files = 0
+        # 跳过原因 -> 目录数
+        self.skipped = Counter()
+        # nfo类型 -> 缺失数
+        self.nfo_missing = Counter()
+        # 需要生成的nfo数，覆盖模式下包括已有的nfo
+        self.nfo_render = 0
+        # 图片类型 -> 缺失数
+        self.images_missing = Counter()
+        # 识别缓存命中和未命中数
+        self.recognize_cache = Counter()
+        # 上游接口 -> 估算请求数
+        self.upstream = Counter()
+        # 当前目录下的文件名，每个媒体目录处理完后清空
+        self._names: Dict[Path, Set[str]] = {}
+
+    def skip(self, reason: str):
+        """
+        记录一个刮削时会跳过的目录
+        """
+        self.skipped[reason] += 1
+
+    def recognize(self, cached: bool):
+        """
+        记录一次识别，未命中识别缓存时需要请求上游
+        """
+        if cached:
+            self.recognize_cache["hit"] += 1
+        else:
+            self.recognize_cache["miss"] += 1
+            self.upstream["recognize"] += 1
+
+    def movie(self, media_dir: MediaDir):
+        """
+        检查电影目录缺失的nfo和图片
+        """
+        self.__begin(media_dir)
+        path = media_dir.path
+        if "BDMV" in self.__list(path):
+            # 原盘目录只生成一个nfo
+            self.__nfo("movie", path / (path.name + ".nfo"))
+        else:
+            for file in media_dir.files:
+                self.__nfo("movie", file.with_suffix(".nfo"))
+        self.__image("poster", path, "poster")
+        self.__image("backdrop", path, "backdrop")
+        self._names.clear()
+
+    def tv(self, media_dir: MediaDir, season_cached: Callable[[int], bool]):
+        """
+        检查电视剧目录缺失的nfo和图片
+        :param season_cached: 判断某一季的识别结果是否已缓存
+        """
+        self.__begin(media_dir)
+        path = media_dir.path
+        self.__nfo("tvshow", path / "tvshow.nfo")
+        self.__image("poster", path, "poster")
+        self.__image("backdrop", path, "backdrop")
+        self.upstream["metadata_img"] += 1
+        seasons = set()
+        for season_dir in sorted({file.parent for file in media_dir.files if file.parent != path}):
+            # Specials或者SPs目录为S0
+            season = 0 if season_dir.name in settings.RENAME_FORMAT_S0_NAMES \
+                else MetaInfo(season_dir.name).begin_season
+            if season is None:
+                continue
+            seasons.add(season)
+            self.__nfo("season", season_dir / "season.nfo")
+            self.__image("season_poster", season_dir.parent,
+                         "season-specials-poster" if season == 0 else f"season{str(season).rjust(2, '0')}-poster")
+            # 季图片和fanart季图片各一次
+            self.upstream["metadata_img"] += 2
+        for file in media_dir.files:
+            self.__nfo("episode", file.with_suffix(".nfo"))
+            self.__image("episode_thumb", file.parent, file.stem)
+        # 没有季目录时按第一季计算
+        for season in seasons or {1}:
+            self.recognize(season_cached(season))
+            self.upstream["tmdb_episodes"] += 1
+        self._names.clear()
+
+    def __begin(self, media_dir: MediaDir):
+        self.directories += 1
+        self.media_files += len(media_dir.files)
+        self.upstream["obtain_images"] += 1
+
+    def __list(self, dir_path: Path) -> Set[str]:
+        """
+        目录下的文件名，同一目录只列出一次
+        """
+        names = self._names.get(dir_path)
+        if names is None:
+            try:
+                names = set(os.listdir(dir_path))
+            except OSError:
+                names = set()
+            self._names[dir_path] = names
+        return names
+
+    def __nfo(self, kind: str, path: Path):
+        if path.name not in self.__list(path.parent):
+            self.nfo_missing[kind] += 1
+            self.nfo_render += 1
+        elif self.overwrite and not self._timed_out(path):
+            self.nfo_render += 1
+
+    def __image(self, kind: str, dir_path: Path, stem: str):
+        if not any(stem + suffix in self.__list(dir_path) for suffix in IMAGE_SUFFIXES):
+            self.images_missing[kind] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        汇总计划，可直接序列化保存
+        """
+        images = sum(self.images_missing.values())
+        return {
+            "created": self.started,
+            "duration": round(time.time() - self.started, 3),
+            "overwrite": self.overwrite,
+            "directories": self.directories,
+            "media_files": self.media_files,
+            "skipped": dict(self.skipped),
+            "nfo": {
+                "missing": dict(self.nfo_missing),
+                "render": self.nfo_render,
+            },
+            "images": {
+                "missing": dict(self.images_missing),
+                "download": images,
+                # 未计入获取图片地址后才能确定的图片
+                "lower_bound": True,
+            },
+            "recognize_cache": dict(self.recognize_cache),
+            "upstream": {**dict(self.upstream), "image_download": images},
+            "image_size": self.image_size,
+            "bytes": images * self.image_size,
+        }
+
+
+def average_image_size(run_stats: Optional[list], default: int) -> int:
+    """
+    按最近几次运行的下载流量估算平均每张图片的字节数，没有记录时使用默认值
+    """
+    total_bytes = 0
+    requests = 0
+    for stats in run_stats or []:
+        total_bytes += stats.get("bytes_downloaded") or 0
+        requests += (stats.get("counters") or {}).get("image_request") or 0
+    if not total_bytes or not requests:
+        return default
+    return int(total_bytes / requests)
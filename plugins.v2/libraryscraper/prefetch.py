@@ -0,0 +1,72 @@
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app import schemas
+from app.chain.tmdb import TmdbChain
+from app.core.config import settings
+from app.log import logger
+
+from .limiter import HostBlocked
+
+
+class SeasonPrefetch:
+    """
+    按季批量获取剧集详情，同一季的所有集共用一次TMDB请求
+    """
+
+    def __init__(self, tmdbchain: Callable[[], TmdbChain] = TmdbChain,
+                 request: Callable[[Callable[[], Any]], Any] = lambda func: func()):
+        """
+        :param tmdbchain: 获取TmdbChain的方法，刮削运行中复用同一个实例
+        :param request: 发起TMDB请求的方法，用于限速和熔断，不请求时抛出HostBlocked
+        """
+        self._tmdbchain = tmdbchain
+        self._request = request
+        self._seasons: Dict[Tuple[int, int, Optional[str]], Dict[int, schemas.TmdbEpisode]] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple[int, int, Optional[str]], threading.Lock] = {}
+
+    def episodes(self, tmdbid: int, season: int,
+                 episode_group: Optional[str] = None) -> Dict[int, schemas.TmdbEpisode]:
+        """
+        获取一季的全部剧集，按集号索引
+        """
+        key = (tmdbid, season, episode_group)
+        with self._lock:
+            if key in self._seasons:
+                return self._seasons[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._seasons:
+                    return self._seasons[key]
+            try:
+                episodes = self._request(lambda: self._tmdbchain().tmdb_episodes(tmdbid=tmdbid, season=season,
+                                                                           episode_group=episode_group))
+            except HostBlocked:
+                raise
+            except Exception as err:
+                logger.warn(f"获取剧集详情失败：{tmdbid} 第{season}季 {str(err)}")
+                episodes = None
+            if episodes is None:
+                # 请求失败，不缓存，之后的剧集再次尝试
+                return {}
+            logger.info(f"已获取 {tmdbid} 第{season}季 {len(episodes)} 集详情")
+            with self._lock:
+                self._seasons[key] = {episode.episode_number: episode for episode in episodes
+                                      if episode.episode_number is not None}
+                return self._seasons[key]
+
+    def still_url(self, tmdbid: int, season: int, episode: int,
+                  episode_group: Optional[str] = None) -> Optional[str]:
+        """
+        获取单集缩略图地址
+        :return: 该季详情获取失败时返回None，已获取但该集没有缩略图时返回空字符串
+        """
+        episodes = self.episodes(tmdbid, season, episode_group)
+        if not episodes:
+            return None
+        tmdb_episode = episodes.get(episode)
+        if not tmdb_episode or not tmdb_episode.still_path:
+            return ""
+        return f"https://{settings.TMDB_IMAGE_DOMAIN}/t/p/original{tmdb_episode.still_path}"
@@ -0,0 +1,111 @@
+import copy
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from app.core.context import MediaInfo
+from app.log import logger
+
+from .store import SqliteStore
+
+
+class RecognizeStore(SqliteStore):
+    """
+    识别结果持久化缓存，过期后视为未命中
+    """
+    _schema = """
+    CREATE TABLE IF NOT EXISTS recognize_cache (
+        key TEXT PRIMARY KEY,
+        data BLOB NOT NULL,
+        expire_at REAL NOT NULL
+    );
+    """
+
+    def get(self, key: str) -> Optional[MediaInfo]:
+        rows = self.execute("SELECT data, expire_at FROM recognize_cache WHERE key = ?", (key,))
+        if not rows or rows[0][1] < time.time():
+            return None
+        try:
+            return pickle.loads(rows[0][0])
+        except Exception as err:
+            logger.debug(f"识别缓存读取失败：{key} {str(err)}")
+            return None
+
+    def put(self, key: str, mediainfo: MediaInfo, ttl: int):
+        self.execute("INSERT OR REPLACE INTO recognize_cache (key, data, expire_at) VALUES (?, ?, ?)",
+                     (key, pickle.dumps(mediainfo), time.time() + ttl))
+
+    def purge(self):
+        """
+        清理已过期的缓存
+        """
+        self.execute("DELETE FROM recognize_cache WHERE expire_at < ?", (time.time(),))
+
+
+class RecognizeCache:
+    """
+    媒体识别结果缓存：本次运行内的LRU缓存，可选叠加持久化缓存
+    同一个键并发加载时只会调用一次识别
+    """
+
+    def __init__(self, maxsize: int = 1024, store: Optional[RecognizeStore] = None, ttl: int = 0):
+        """
+        :param maxsize: 内存缓存条目上限
+        :param store: 持久化缓存，为空时只缓存本次运行
+        :param ttl: 持久化缓存有效期，单位秒
+        """
+        self._maxsize = maxsize
+        self._store = store
+        self._ttl = ttl
+        self._cache: OrderedDict[str, MediaInfo] = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        """
+        生成缓存键，如：(tmdbid, mtype, season, episode_group)
+        """
+        return "|".join("" if part is None else str(getattr(part, "value", part)) for part in parts)
+
+    def __get(self, key: str) -> Optional[MediaInfo]:
+        with self._lock:
+            mediainfo = self._cache.get(key)
+            if mediainfo:
+                self._cache.move_to_end(key)
+                return mediainfo
+        if self._store:
+            mediainfo = self._store.get(key)
+            if mediainfo:
+                self.__put(key, mediainfo)
+                return mediainfo
+        return None
+
+    def __put(self, key: str, mediainfo: MediaInfo):
+        with self._lock:
+            self._cache[key] = mediainfo
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._maxsize:
+                self._cache.popitem(last=False)
+
+    def get_or_load(self, key: str, loader: Callable[[], Optional[MediaInfo]]) -> Optional[MediaInfo]:
+        """
+        查询缓存，未命中时调用loader识别并缓存结果
+        返回结果的副本，调用方修改不会影响缓存
+        """
+        mediainfo = self.__get(key)
+        if not mediainfo:
+            with self._lock:
+                key_lock = self._key_locks.setdefault(key, threading.Lock())
+            with key_lock:
+                mediainfo = self.__get(key)
+                if not mediainfo:
+                    mediainfo = loader()
+                    if not mediainfo:
+                        return None
+                    self.__put(key, mediainfo)
+                    if self._store and self._ttl:
+                        self._store.put(key, mediainfo, self._ttl)
+        return copy.deepcopy(mediainfo)
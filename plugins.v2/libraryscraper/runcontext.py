@@ -0,0 +1,40 @@
+import threading
+from typing import Callable, Optional, TypeVar
+
+from app.chain.media import MediaChain
+from app.chain.tmdb import TmdbChain
+
+from .metrics import RunMetrics, timer
+
+T = TypeVar("T")
+
+
+class RunContext:
+    """
+    刮削运行上下文：每个刮削线程在本次运行中只创建一次MediaChain和TmdbChain，之后的调用都复用
+    """
+
+    def __init__(self, metrics: Optional[RunMetrics] = None):
+        self._metrics = metrics
+        self._local = threading.local()
+
+    def __get(self, name: str, factory: Callable[[], T]) -> T:
+        instance = getattr(self._local, name, None)
+        if instance is not None:
+            if self._metrics:
+                self._metrics.incr("chain_reused")
+            return instance
+        with timer(self._metrics, "chain_init"):
+            instance = factory()
+        if self._metrics:
+            self._metrics.incr("chain_created")
+        setattr(self._local, name, instance)
+        return instance
+
+    @property
+    def mediachain(self) -> MediaChain:
+        return self.__get("mediachain", MediaChain)
+
+    @property
+    def tmdbchain(self) -> TmdbChain:
+        return self.__get("tmdbchain", TmdbChain)
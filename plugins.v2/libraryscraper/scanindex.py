@@ -0,0 +1,134 @@
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+
+from .store import SqliteStore
+
+
+@dataclass
+class DirFingerprint:
+    """
+    媒体目录指纹：目录内媒体文件的最新修改时间和文件数量
+    """
+    mtime: float = 0
+    file_count: int = 0
+
+    @classmethod
+    def from_files(cls, files: Iterable[Path]) -> "DirFingerprint":
+        """
+        根据目录下的媒体文件计算指纹
+        """
+        fingerprint = cls()
+        for file in files:
+            try:
+                mtime = file.stat().st_mtime
+            except OSError:
+                continue
+            fingerprint.file_count += 1
+            fingerprint.mtime = max(fingerprint.mtime, mtime)
+        return fingerprint
+
+
+@dataclass
+class ScanRecord:
+    """
+    媒体目录的刮削记录
+    """
+    path: str
+    mtype: Optional[str]
+    mtime: float
+    file_count: int
+    tmdbid: Optional[int]
+    scrape_time: float
+
+
+class ScanIndex(SqliteStore):
+    """
+    媒体目录刮削索引，记录每个目录上次刮削时的指纹，指纹未变化的目录可跳过
+    """
+    _schema = """
+    CREATE TABLE IF NOT EXISTS media_dir (
+        path TEXT PRIMARY KEY,
+        mtype TEXT,
+        mtime REAL NOT NULL DEFAULT 0,
+        file_count INTEGER NOT NULL DEFAULT 0,
+        tmdbid INTEGER,
+        scrape_time REAL NOT NULL DEFAULT 0
+    );
+    """
+
+    def get(self, path: Path) -> Optional[ScanRecord]:
+        """
+        查询目录的刮削记录
+        """
+        rows = self.execute("SELECT path, mtype, mtime, file_count, tmdbid, scrape_time "
+                            "FROM media_dir WHERE path = ?", (str(path),))
+        if not rows:
+            return None
+        return ScanRecord(*rows[0])
+
+    def is_unchanged(self, path: Path, mtype: Optional[str], fingerprint: DirFingerprint) -> bool:
+        """
+        判断目录自上次刮削以来是否未发生变化
+        """
+        record = self.get(path)
+        if not record:
+            return False
+        return record.mtype == mtype \
+            and record.file_count == fingerprint.file_count \
+            and record.mtime == fingerprint.mtime
+
+    def update(self, path: Path, mtype: Optional[str], fingerprint: DirFingerprint, tmdbid: Optional[int]):
+        """
+        记录目录刮削完成时的指纹
+        """
+        self.execute("INSERT OR REPLACE INTO media_dir (path, mtype, mtime, file_count, tmdbid, scrape_time) "
+                     "VALUES (?, ?, ?, ?, ?, ?)",
+                     (str(path), mtype, fingerprint.mtime, fingerprint.file_count, tmdbid, time.time()))
+
+    def remove(self, path: Path):
+        """
+        删除目录的刮削记录
+        """
+        self.execute("DELETE FROM media_dir WHERE path = ?", (str(path),))
+
+    def clear(self):
+        """
+        清空索引
+        """
+        self.execute("DELETE FROM media_dir")
+
+
+class RunCheckpoint(SqliteStore):
+    """
+    刮削运行断点：记录本次运行已提交和已完成的媒体目录，中断后下次运行从断点继续
+    """
+    _schema = """
+    CREATE TABLE IF NOT EXISTS run_checkpoint (
+        path TEXT NOT NULL,
+        mtype TEXT NOT NULL DEFAULT '',
+        done INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (path, mtype)
+    );
+    """
+
+    def completed(self) -> Set[Tuple[str, str]]:
+        """
+        上次运行中已完成的目录
+        """
+        return set(self.execute("SELECT path, mtype FROM run_checkpoint WHERE done = 1"))
+
+    def pending(self) -> List[Tuple[str, str]]:
+        """
+        上次运行中已提交但未完成的目录
+        """
+        return self.execute("SELECT path, mtype FROM run_checkpoint WHERE done = 0 ORDER BY updated_at")
+
+    def mark(self, path: Path, mtype: Optional[str], done: bool):
+        self.execute("INSERT OR REPLACE INTO run_checkpoint (path, mtype, done, updated_at) VALUES (?, ?, ?, ?)",
+                     (str(path), mtype or "", 1 if done else 0, time.time()))
+
+    def clear(self):
+        self.execute("DELETE FROM run_checkpoint")
@@ -0,0 +1,120 @@
+import heapq
+import os
+import time
+from pathlib import Path
+from threading import Event
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app.log import logger
+
+from .discovery import MediaDir
+from .planner import IMAGE_SUFFIXES
+from .store import SqliteStore
+
+
+class PriorityRequests(SqliteStore):
+    """
+    用户指定优先刮削的路径，对应的媒体目录刮削完成后移除
+    """
+    _schema = """
+    CREATE TABLE IF NOT EXISTS priority_request (
+        path TEXT PRIMARY KEY,
+        requested_at REAL NOT NULL
+    );
+    """
+
+    def add(self, path: Path):
+        self.execute("INSERT OR REPLACE INTO priority_request (path, requested_at) VALUES (?, ?)",
+                     (str(path), time.time()))
+
+    def paths(self) -> List[Path]:
+        return [Path(row[0]) for row in self.execute("SELECT path FROM priority_request ORDER BY requested_at")]
+
+    def remove(self, path: Path):
+        self.execute("DELETE FROM priority_request WHERE path = ?", (str(path),))
+
+
+class PriorityScheduler:
+    """
+    媒体目录优先级调度：先收集全部待刮削目录，再按用户指定、缺失的元数据数量、最近变化时间依次刮削
+    目录发现只遍历文件系统，相比刮削耗时很短，新入库的剧集不必排在大量已刮削的旧目录之后
+    """
+
+    def __init__(self, requests: PriorityRequests, dateadded: Callable[[Path], Optional[float]], event: Event):
+        """
+        :param requests: 用户指定优先刮削的路径
+        :param dateadded: 查询目录下nfo中最晚的添加时间戳，不读取nfo文件
+        :param event: 退出事件，设置后目录发现提前结束
+        """
+        self._requests = requests
+        self._dateadded = dateadded
+        self._event = event
+
+    def order(self, media_dirs: Iterable[MediaDir]) -> Iterator[MediaDir]:
+        """
+        按优先级产出媒体目录，第一次取值时遍历完所有目录
+        """
+        requested = self._requests.paths()
+        matched: Set[Path] = set()
+        heap: List[Tuple[Tuple[int, int, float], int, MediaDir]] = []
+        for seq, media_dir in enumerate(media_dirs):
+            # 优先路径可以是媒体目录本身、其上级目录或其中的季目录和文件
+            paths = {path for path in requested
+                     if media_dir.path.is_relative_to(path) or path.is_relative_to(media_dir.path)}
+            if paths:
+                matched.update(paths)
+                media_dir.requested = sorted(paths)
+            # 堆顶为最小值，优先级高的取负数
+            priority = (0 if paths else 1, -self.missing(media_dir), -self.recency(media_dir))
+            heapq.heappush(heap, (priority, seq, media_dir))
+        # 目录发现被中断时未遍历到的路径保留到下次运行
+        if not self._event.is_set():
+            for path in set(requested) - matched:
+                logger.warn(f"未找到优先刮削路径对应的媒体目录：{path}")
+                self._requests.remove(path)
+        if heap:
+            logger.info(f"共发现 {len(heap)} 个媒体目录，按优先级开始刮削")
+        while heap:
+            _, _, media_dir = heapq.heappop(heap)
+            if media_dir.requested:
+                logger.info(f"优先刮削：{media_dir.path}")
+            yield media_dir
+
+    @staticmethod
+    def missing(media_dir: MediaDir) -> int:
+        """
+        缺失的元数据种类数：有媒体文件没有nfo、目录没有海报图片
+        """
+        names: Dict[Path, Set[str]] = {}
+
+        def __list(dir_path: Path) -> Set[str]:
+            if dir_path not in names:
+                try:
+                    names[dir_path] = set(os.listdir(dir_path))
+                except OSError:
+                    names[dir_path] = set()
+            return names[dir_path]
+
+        path = media_dir.path
+        missing = 0
+        if "BDMV" in __list(path):
+            # 原盘目录只有一个nfo
+            if path.name + ".nfo" not in __list(path):
+                missing += 1
+        elif any(file.with_suffix(".nfo").name not in __list(file.parent) for file in media_dir.files):
+            missing += 1
+        if not any("poster" + suffix in __list(path) for suffix in IMAGE_SUFFIXES):
+            missing += 1
+        return missing
+
+    def recency(self, media_dir: MediaDir) -> float:
+        """
+        目录最近一次变化的时间戳：目录和媒体文件的修改时间、nfo的添加时间中最晚的
+        """
+        latest = 0.0
+        for path in (media_dir.path, *media_dir.files):
+            try:
+                latest = max(latest, path.stat().st_mtime)
+            except OSError:
+                continue
+        return max(latest, self._dateadded(media_dir.path) or 0.0)
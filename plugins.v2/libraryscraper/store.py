@@ -0,0 +1,50 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Iterable, List, Sequence
+
+
+class SqliteStore:
+    """
+    插件数据目录下的SQLite存储，多个线程共享同一个连接
+    """
+    # 建表语句，由子类定义
+    _schema: str = ""
+
+    def __init__(self, db_path: Path):
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            if self._schema:
+                self._conn.executescript(self._schema)
+                self._conn.commit()
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        """
+        执行SQL并返回全部结果
+        """
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            rows = cursor.fetchall()
+            self._conn.commit()
+            return rows
+
+    def executemany(self, sql: str, params: Iterable[Sequence[Any]]):
+        """
+        批量执行SQL
+        """
+        with self._lock:
+            self._conn.executemany(sql, params)
+            self._conn.commit()
+
+    def close(self):
+        """
+        关闭连接
+        """
+        with self._lock:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
@@ -0,0 +1,86 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Union
+
+from app import schemas
+from app.core.context import MediaInfo
+from app.core.meta import MetaBase
+
+from .listing import DirListing
+from .writer import MetadataWriter
+
+
+@dataclass
+class ScrapeState:
+    """
+    一次刮削共用的状态
+    """
+    meta: MetaBase
+    mediainfo: MediaInfo
+    overwrite: bool
+    listing: DirListing
+    writer: MetadataWriter
+    # 生成或保存失败、且未加入重试队列的文件，图片在下载线程中追加
+    failures: List[Path] = field(default_factory=list)
+
+
+@dataclass
+class DirFrame:
+    """
+    工作队列中的一个目录层级，子项按页取出，处理完一页后再取下一页
+    """
+    fileitem: schemas.FileItem
+    # 上级目录，未知时为None
+    parent: Optional[schemas.FileItem] = None
+    # 是否生成该目录自身的nfo和图片
+    init_folder: bool = True
+    # 尚未取出的子项
+    children: Optional[Iterator[schemas.FileItem]] = None
+
+
+@dataclass
+class FileTask:
+    """
+    刮削一个媒体文件
+    """
+    fileitem: schemas.FileItem
+    parent: Optional[schemas.FileItem] = None
+
+
+@dataclass
+class NfoTask:
+    """
+    生成并保存一个nfo文件
+    """
+    # nfo保存的目录，为None时取owner的上级目录
+    dir_item: Optional[schemas.FileItem]
+    owner: Optional[schemas.FileItem]
+    storage: str
+    path: Path
+    render: Callable[[], Optional[Union[str, bytes]]]
+    # 生成失败时的提示
+    failure: str
+
+
+@dataclass
+class ImageTask:
+    """
+    下载并保存一张图片，与nfo任务互不影响
+    """
+    # 图片保存的目录，为None时取owner的上级目录
+    dir_item: Optional[schemas.FileItem]
+    owner: Optional[schemas.FileItem]
+    storage: str
+    path: Path
+    url: str
+
+
+@dataclass
+class ReleaseTask:
+    """
+    目录处理完成后释放其列表快照
+    """
+    fileitem: schemas.FileItem
+
+
+ScrapeTask = Union[DirFrame, FileTask, NfoTask, ImageTask, ReleaseTask]
@@ -0,0 +1,163 @@
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.log import logger
+
+from .discovery import LibraryDiscovery, MediaDir
+
+try:
+    from watchdog.events import FileSystemEventHandler, FileSystemEvent
+    from watchdog.observers import Observer
+    from watchdog.observers.polling import PollingObserver
+except ImportError:
+    FileSystemEventHandler = object
+    FileSystemEvent = None
+    Observer = PollingObserver = None
+
+
+class _EventHandler(FileSystemEventHandler):
+    """
+    只关心媒体文件的新增、移动和目录的新增、移动，刮削写入的nfo和图片不会触发
+    """
+
+    def __init__(self, watcher: "LibraryWatcher"):
+        super().__init__()
+        self._watcher = watcher
+
+    def on_created(self, event: FileSystemEvent):
+        self._watcher.touch(event.src_path, event.is_directory)
+
+    def on_moved(self, event: FileSystemEvent):
+        self._watcher.touch(event.dest_path, event.is_directory)
+
+    def on_modified(self, event: FileSystemEvent):
+        # 目录修改事件由目录内文件变化引起，不处理
+        if not event.is_directory:
+            self._watcher.touch(event.src_path, False)
+
+
+class LibraryWatcher:
+    """
+    媒体库目录监控：订阅文件系统变化，合并一段时间内的事件后只刮削受影响的媒体目录
+    """
+
+    def __init__(self, discovery: LibraryDiscovery, roots: List, callback: Callable[[List[MediaDir]], None],
+                 debounce: int = 60, polling: bool = False):
+        """
+        :param discovery: 媒体目录发现
+        :param roots: 刮削路径及强制指定的媒体类型
+        :param callback: 刮削受影响媒体目录的回调
+        :param debounce: 最后一次变化后等待的秒数，期间的变化合并处理
+        :param polling: 是否使用轮询模式，适用于网络共享等不支持inotify的目录
+        """
+        self._discovery = discovery
+        self._roots = roots
+        self._callback = callback
+        self._debounce = max(1, debounce)
+        self._polling = polling
+        self._observer = None
+        # 变化的路径 -> (是否目录, 最后变化时间)
+        self._pending: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._flush_thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def available() -> bool:
+        return Observer is not None
+
+    def start(self):
+        """
+        开始监控所有刮削路径
+        """
+        if not self.available():
+            logger.error("未安装watchdog，无法启用目录监控")
+            return
+        self._observer = self.__schedule(PollingObserver() if self._polling else Observer())
+        try:
+            self._observer.start()
+        except OSError as err:
+            # inotify监控数量不足等情况下退回轮询模式
+            logger.warn(f"目录监控启动失败：{str(err)}，切换为兼容模式")
+            self._observer = self.__schedule(PollingObserver())
+            self._observer.start()
+        self._flush_thread = threading.Thread(target=self.__flush_loop, name="LibraryScraperOwn-Watcher",
+                                              daemon=True)
+        self._flush_thread.start()
+
+    def __schedule(self, observer):
+        handler = _EventHandler(self)
+        for root, _ in self._roots:
+            if not root.exists():
+                logger.warn(f"监控目录不存在：{root}")
+                continue
+            observer.schedule(handler, str(root), recursive=True)
+            logger.info(f"已开始监控目录：{root}")
+        return observer
+
+    def stop(self):
+        """
+        停止监控
+        """
+        self._stop_event.set()
+        if self._observer:
+            try:
+                self._observer.stop()
+                self._observer.join(timeout=10)
+            except Exception as err:
+                logger.debug(f"停止目录监控出错：{str(err)}")
+            self._observer = None
+        if self._flush_thread:
+            self._flush_thread.join(timeout=10)
+            self._flush_thread = None
+
+    def touch(self, path: str, is_directory: bool):
+        """
+        记录一次路径变化
+        """
+        if not is_directory and Path(path).suffix.lower() not in settings.RMT_MEDIAEXT:
+            return
+        with self._lock:
+            self._pending[path] = (is_directory, time.time())
+
+    def __flush_loop(self):
+        while not self._stop_event.wait(1):
+            now = time.time()
+            with self._lock:
+                ready = [(path, is_dir) for path, (is_dir, changed) in self._pending.items()
+                         if now - changed >= self._debounce]
+                for path, _ in ready:
+                    self._pending.pop(path, None)
+            if not ready:
+                continue
+            media_dirs = self.__resolve(ready)
+            if not media_dirs:
+                continue
+            logger.info(f"监控到 {len(media_dirs)} 个媒体目录发生变化")
+            try:
+                self._callback(media_dirs)
+            except Exception as err:
+                logger.error(f"监控目录刮削失败：{str(err)}")
+
+    def __resolve(self, changes: List[tuple]) -> List[MediaDir]:
+        """
+        将变化的路径转换为需要刮削的媒体目录
+        """
+        media_dirs: Dict[tuple, MediaDir] = {}
+        for path, is_dir in changes:
+            path = Path(path)
+            if not path.exists():
+                continue
+            files = list(self._discovery.walk(path)) if is_dir else [path]
+            for file_path in files:
+                located = self._discovery.locate(file_path, self._roots)
+                if not located or located in media_dirs:
+                    continue
+                media_path, mtype = located
+                # 重新收集整个媒体目录的文件，用于计算指纹
+                media_dirs[located] = MediaDir(path=media_path, mtype=mtype,
+                                               files=list(self._discovery.walk(media_path)))
+        return list(media_dirs.values())
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+from app import schemas
+from app.chain.storage import StorageChain
+from app.core.config import settings
+from app.log import logger
+from app.utils.string import StringUtils
+
+from .metrics import RunMetrics, timer
+
+
+class MetadataWriter:
+    """
+    元数据文件写入：本地存储直接原子写入目标目录，其它存储经内存文件系统中转后上传
+    """
+    # 内存文件系统，存在时上传前的中转文件不落盘
+    _memory_path = Path("/dev/shm")
+    # 比较nfo内容时忽略的易变字段
+    _volatile_pattern = re.compile(rb"<dateadded>.*?</dateadded>", re.S)
+    # 本地写入时同目录下的临时文件名
+    _temp_pattern = re.compile(r"^\..+\.[A-Za-z0-9]{6}\.tmp$")
+    # 超过该秒数仍未重命名的临时文件视为中途崩溃的残留
+    stale_temp_age = 3600
+
+    def __init__(self, storagechain: StorageChain, metrics: Optional[RunMetrics] = None):
+        self._storagechain = storagechain
+        self._metrics = metrics
+        self._staging_path = self._memory_path \
+            if self._memory_path.is_dir() and os.access(self._memory_path, os.W_OK) else settings.TEMP_PATH
+        # 本次运行写入和内容未变化跳过的文件数
+        self.written = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def digest(cls, content: bytes) -> str:
+        """
+        计算nfo内容哈希，忽略dateadded等每次生成都会变化的字段
+        """
+        return hashlib.sha256(cls._volatile_pattern.sub(b"", content).strip()).hexdigest()
+
+    def __unchanged(self, fileitem: schemas.FileItem, name: str, content: bytes) -> bool:
+        """
+        判断目标文件内容是否与新内容一致，目前只支持本地存储
+        """
+        if fileitem.storage != "local":
+            return False
+        try:
+            existing = (Path(fileitem.path) / name).read_bytes()
+        except OSError:
+            return False
+        return self.digest(existing) == self.digest(content)
+
+    def __count(self, written: bool):
+        with self._lock:
+            if written:
+                self.written += 1
+            else:
+                self.skipped += 1
+
+    def save(self, fileitem: schemas.FileItem, name: str, content: Union[bytes, str],
+             compare: bool = False) -> bool:
+        """
+        保存文件到目录
+        :param fileitem: 保存的目录项
+        :param name: 文件名
+        :param content: 文件内容
+        :param compare: 是否先与已有文件比较，内容未变化时不写入
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        if compare and self.__unchanged(fileitem, name, content):
+            logger.debug(f"文件内容未变化，跳过写入：{Path(fileitem.path) / name}")
+            self.__count(False)
+            return True
+        with timer(self._metrics, "save"):
+            if fileitem.storage == "local":
+                saved = self.write_local(Path(fileitem.path) / name, content)
+            else:
+                saved = self.__upload(fileitem, name, content)
+        if saved:
+            self.__count(True)
+            if self._metrics:
+                self._metrics.incr(f"storage_write_{fileitem.storage}")
+        return saved
+
+    @classmethod
+    def is_stale_temp(cls, name: str, mtime: Optional[float]) -> bool:
+        """
+        判断是否为写入中途崩溃残留的临时文件
+        """
+        return bool(cls._temp_pattern.match(name)) \
+            and mtime is not None and time.time() - mtime > cls.stale_temp_age
+
+    @staticmethod
+    def write_local(target: Path, content: bytes) -> bool:
+        """
+        写入同目录下的临时文件后重命名，中途失败不会留下不完整的文件
+        进程在重命名前被终止时残留的临时文件，在之后列出该目录时清理
+        """
+        tmp_file = target.with_name(f".{target.name}.{StringUtils.generate_random_str(6)}.tmp")
+        try:
+            tmp_file.write_bytes(content)
+            os.replace(tmp_file, target)
+            logger.info(f"已保存文件：{target}")
+            return True
+        except OSError as err:
+            logger.warn(f"文件保存失败：{target} {str(err)}")
+            return False
+        finally:
+            if tmp_file.exists():
+                tmp_file.unlink()
+
+    def __upload(self, fileitem: schemas.FileItem, name: str, content: bytes) -> bool:
+        """
+        通过存储模块上传文件
+        """
+        tmp_file = self._staging_path / f"{name}.{StringUtils.generate_random_str(10)}"
+        try:
+            tmp_file.write_bytes(content)
+            item = self._storagechain.upload_file(fileitem=fileitem, path=tmp_file, new_name=name)
+            if item:
+                logger.info(f"已保存文件：{item.path}")
+                return True
+            logger.warn(f"文件保存失败：{Path(fileitem.path) / name}")
+            return False
+        finally:
+            if tmp_file.exists():
+                tmp_file.unlink()